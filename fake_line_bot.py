@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+
+class FakeProfile:
+    def __init__(self, user_id, display_name):
+        self.user_id = user_id
+        self.display_name = display_name
+
+class FakeLineBotApi:
+    """
+    Stand-in for LineBotApi, for running Master without LINE.
+
+    get_profile answers with display_names, or "Player <user_id>" for users
+    not in it. Every reply_message, push_message and leave_group call is
+    recorded in replies, pushes and left_groups respectively, unless record
+    is False, e.g. for long benchmarks. Calls are counted either way.
+    """
+    def __init__(self, display_names=None, record=True):
+        self.display_names = display_names or {}
+        self.record = record
+        self.replies = []                  # (reply_token, messages) per reply_message call
+        self.pushes = []                   # (to, messages) per push_message call
+        self.left_groups = []
+        self.profile_calls = 0
+        self.reply_calls = 0
+        self.push_calls = 0
+
+    def get_profile(self, user_id):
+        self.profile_calls += 1
+        return FakeProfile(user_id, self.display_names.get(user_id, "Player " + str(user_id)))
+
+    def reply_message(self, reply_token, messages):
+        self.reply_calls += 1
+        if self.record:
+            self.replies.append((reply_token, messages))
+
+    def push_message(self, to, messages):
+        self.push_calls += 1
+        if self.record:
+            self.pushes.append((to, messages))
+
+    def leave_group(self, group_id):
+        if self.record:
+            self.left_groups.append(group_id)
+
+class FakeBlockingLineBotApi(FakeLineBotApi):
+    """
+    Stand-in for LineBotApi whose calls block for latency seconds, to
+    mimic the round trip to the Messaging API from many threads at once.
+    Calls are counted under a lock.
+    """
+    def __init__(self, display_names=None, latency=0, record=True):
+        FakeLineBotApi.__init__(self, display_names, record)
+        self.latency = latency
+        self.lock = threading.Lock()
+
+    def get_profile(self, user_id):
+        time.sleep(self.latency)
+        with self.lock:
+            return FakeLineBotApi.get_profile(self, user_id)
+
+    def reply_message(self, reply_token, messages):
+        time.sleep(self.latency)
+        with self.lock:
+            FakeLineBotApi.reply_message(self, reply_token, messages)
+
+    def push_message(self, to, messages):
+        time.sleep(self.latency)
+        with self.lock:
+            FakeLineBotApi.push_message(self, to, messages)
+
+    def leave_group(self, group_id):
+        time.sleep(self.latency)
+        with self.lock:
+            FakeLineBotApi.leave_group(self, group_id)
+
+class FakeAsyncLineBotApi(FakeLineBotApi):
+    """
+    Asynchronous stand-in for LineBotApi, for running AsyncDispatcher
+    without LINE. Each call sleeps for latency seconds to mimic the
+    round trip to the Messaging API.
+    """
+    def __init__(self, display_names=None, latency=0, record=True):
+        FakeLineBotApi.__init__(self, display_names, record)
+        self.latency = latency
+
+    async def get_profile(self, user_id):
+        await asyncio.sleep(self.latency)
+        return FakeLineBotApi.get_profile(self, user_id)
+
+    async def reply_message(self, reply_token, messages):
+        await asyncio.sleep(self.latency)
+        FakeLineBotApi.reply_message(self, reply_token, messages)
+
+    async def push_message(self, to, messages):
+        await asyncio.sleep(self.latency)
+        FakeLineBotApi.push_message(self, to, messages)
+
+    async def leave_group(self, group_id):
+        await asyncio.sleep(self.latency)
+        FakeLineBotApi.leave_group(self, group_id)
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+
+from hangman_metrics import COUNT_BUCKETS
+from modular_hangman import Master, ProfileCache
+
+logger = logging.getLogger(__name__)
+
+class AsyncMaster(Master):
+    """
+    Master for use under AsyncDispatcher.
+
+    Game logic stays synchronous and runs on the event loop. Calls to the
+    Messaging API are not made here. They are collected in outbox instead,
+    and AsyncDispatcher awaits them against the asynchronous bot client
+    once the event is handled.
+
+    Profiles are fetched ahead of dispatch by AsyncDispatcher, so the
+    profile cache has no bot to fall back to.
+    """
+    def __init__(self, line_bot_api, profile_cache_size=1024, profile_ttl=3600, **kwargs):
+        Master.__init__(self, line_bot_api, profile_cache_size, profile_ttl, **kwargs)
+        self.profiles = ProfileCache(None, max_size=profile_cache_size, ttl=profile_ttl)
+        self.outbox = []                   # Pending API calls, as (method name, args)
+
+    def post_reply(self, token, chat_array):
+        self.outbox.append(("reply_message", (token, chat_array)))
+
+    def post_push(self, to, chat_array):
+        self.outbox.append(("push_message", (to, chat_array)))
+
+    def leave_group(self, group_id):
+        self.remove_game(group_id)
+        self.outbox.append(("leave_group", (group_id,)))
+
+    def take_outbox(self):
+        outbox = self.outbox
+        self.outbox = []
+        return outbox
+
+class AsyncDispatcher:
+    """
+    asyncio front end to Master.query_reply.
+
+    Every event is put on the queue of the group it belongs to: group_id
+    for group chat, and the group the user plays in for private chat. Each
+    queue has its own worker that handles its events one at a time, so a
+    game never sees two events interleaved, while different groups are
+    handled concurrently. A slow reply_message only holds up its own group.
+
+    Queues are bounded by max_queue_size. submit waits while the queue of
+    its group is full, which pushes back on the webhook.
+
+    Batched letter guesses, with batch_window set, and messages that
+    didn't fit in their reply wait in the master until flush is awaited.
+
+    The bot client must offer get_profile, reply_message, push_message
+    and leave_group as coroutines, e.g. fake_line_bot.FakeAsyncLineBotApi.
+    """
+    def __init__(self, client, max_queue_size=64, master=None):
+        self.client = client
+        self.master = master if master is not None else AsyncMaster(client)
+        self.max_queue_size = max_queue_size
+        self.queues = {}                   # key -> asyncio.Queue of events
+        self.workers = {}                  # key -> worker task
+        self.pending_puts = {}             # key -> submit calls waiting on a full queue
+
+    def queue_key(self, channel, user_id, group_id):
+        if channel == "public":
+            return group_id
+        # Private chat belongs to the game the user plays in, if any.
+        return self.master.memberships.get(user_id, ("private", user_id))
+
+    async def submit(self, token, channel, received_text, user_id, group_id=None):
+        """
+        Queue an event. Return once it is queued, not handled.
+        """
+        key = self.queue_key(channel, user_id, group_id)
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = asyncio.Queue(self.max_queue_size)
+            self.workers[key] = asyncio.create_task(self.work(key, queue))
+
+        if self.master.metrics is not None:
+            self.master.metrics.observe("hangman_queue_depth", queue.qsize(), buckets=COUNT_BUCKETS)
+        self.pending_puts[key] = self.pending_puts.get(key, 0) + 1
+        try:
+            await queue.put((token, channel, received_text, user_id, group_id))
+        finally:
+            self.pending_puts[key] -= 1
+            if not self.pending_puts[key]:
+                del self.pending_puts[key]
+
+    async def work(self, key, queue):
+        while True:
+            event = await queue.get()
+            try:
+                await self.handle(*event)
+            except Exception:
+                logger.exception("Failed to handle event for %r", key)
+            finally:
+                queue.task_done()
+
+            if queue.empty() and key not in self.pending_puts:
+                # Idle. Drop the queue, a new one is made on the next event.
+                del self.queues[key]
+                del self.workers[key]
+                return
+
+    async def handle(self, token, channel, received_text, user_id, group_id):
+        await self.prefetch_profile(channel, received_text, user_id, group_id)
+        self.master.query_reply(token, channel, received_text, user_id, group_id=group_id)
+        await self.send_outbox()
+
+    async def flush(self):
+        """
+        Reply to every batch open for batch_window seconds, see
+        Master.flush_batches, and push every queued message, see
+        Master.flush_pushes. Call this instead of those two, which only
+        fill the outbox, or let flush_periodically do it.
+        """
+        self.master.flush_batches()
+        self.master.flush_pushes()
+        await self.send_outbox()
+
+    async def flush_periodically(self, interval=None):
+        """
+        Flush every interval seconds until cancelled. interval defaults
+        to batch_window, or a second with batching off. Run as a task
+        next to the webhook, so a lone guess is not held.
+        """
+        if interval is None:
+            interval = self.master.batch_window or 1.0
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to flush")
+
+    async def send_outbox(self):
+        for method, args in self.master.take_outbox():
+            await getattr(self.client, method)(*args)
+
+    async def prefetch_profile(self, channel, received_text, user_id, group_id):
+        """
+        Fetch the profile of user_id into the profile cache, if the
+        game is going to need display_name for received_text.
+        """
+        if channel == "private":
+            group_id = self.master.memberships.get(user_id)
+        game = self.master.games.get(group_id)
+        if received_text not in getattr(game, "profile_keywords", ()):
+            return
+
+        profiles = self.master.profiles
+        if profiles.lookup(user_id) is not None:
+            return
+        try:
+            profile = await self.client.get_profile(user_id)
+        except Exception:
+            profiles.store_failure(user_id)
+        else:
+            profiles.store(user_id, profile.display_name)
+
+    async def join(self):
+        """
+        Wait until every queued event is handled.
+        """
+        while self.workers:
+            await asyncio.gather(*list(self.workers.values()))
@@ -0,0 +1,405 @@
+"""
+Synthetic load generator and benchmark for Master and Hangman.
+
+Drives Master.query_reply with a fake line_bot_api and reports events per
+second, p50/p99 latency per command and, with --allocations, peak bytes
+allocated per event. Use --json to keep results for comparison across
+commits, e.g.
+
+    python hangman_benchmark.py --groups 200 --events 200000 --json bench.json
+"""
+import argparse
+import itertools
+import json
+import random
+import string
+import sys
+import time
+import timeit
+import tracemalloc
+
+from fake_line_bot import FakeLineBotApi
+from hangman_metrics import Metrics
+from hangman_ratelimit import RateLimiter
+from modular_hangman import Hangman, Leaderboard, Master, Messenger
+
+class Workload:
+    """
+    Shape of the synthetic traffic.
+
+    Of the events after setup, guess_ratio are guesses (word_guess_ratio of
+    those whole-phrase guesses, the rest single letters), scoreboard_ratio
+    are /scoreboard, history_ratio are /history and the rest plain chatter.
+    Phrases are random words, phrase_length characters long overall.
+    """
+    def __init__(self, groups=50, players=5, events=50000, phrase_length=(5, 40),
+                 guess_ratio=0.5, word_guess_ratio=0.05, scoreboard_ratio=0.02,
+                 history_ratio=0.01, seed=0):
+        self.groups = groups
+        self.players = players
+        self.events = events
+        self.phrase_length = tuple(phrase_length)
+        self.guess_ratio = guess_ratio
+        self.word_guess_ratio = word_guess_ratio
+        self.scoreboard_ratio = scoreboard_ratio
+        self.history_ratio = history_ratio
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    def phrase(self, generator):
+        length = generator.randint(*self.phrase_length)
+        words = []
+        while sum(len(word) + 1 for word in words) < length:
+            words.append("".join(generator.choice(string.ascii_lowercase)
+                                 for i in range(generator.randint(3, 9))))
+        return " ".join(words)[:max(length, 5)]
+
+    def setup_events(self):
+        """
+        Yield (command, token, channel, text, user_id, group_id) that give
+        every group a game and its players.
+        """
+        for group in range(self.groups):
+            group_id = "G%d" % group
+            yield "/gameon", "token", "public", "/gameon", "host", group_id
+            for player in range(self.players):
+                yield "/join", "token", "public", "/join", "U%d-%d" % (group, player), group_id
+
+    def traffic_events(self, master):
+        """
+        Yield the main traffic, looking at master to feed paused games.
+        """
+        generator = random.Random(self.seed)
+        for event in range(self.events):
+            group = generator.randrange(self.groups)
+            group_id = "G%d" % group
+            user_id = "U%d-%d" % (group, generator.randrange(self.players))
+            game = master.games[group_id]
+
+            if game.paused:
+                # Out of words. Someone adds one privately and continues.
+                yield "/add", "token", "private", "/add " + self.phrase(generator), user_id, None
+                yield "/continue", "token", "public", "/continue", user_id, group_id
+                continue
+
+            if user_id == game.active_word_source:
+                # The giver can't guess. Let another player have the turn.
+                user_id = "U%d-%d" % (group, (int(user_id.rsplit("-", 1)[1]) + 1) % self.players)
+
+            roll = generator.random()
+            if roll < self.guess_ratio:
+                if generator.random() < self.word_guess_ratio:
+                    yield "word", "token", "public", "/" + game.active_word.lower(), user_id, group_id
+                else:
+                    yield "letter", "token", "public", generator.choice(string.ascii_uppercase), user_id, group_id
+            elif roll < self.guess_ratio + self.scoreboard_ratio:
+                yield "/scoreboard", "token", "public", "/scoreboard", user_id, group_id
+            elif roll < self.guess_ratio + self.scoreboard_ratio + self.history_ratio:
+                yield "/history", "token", "public", "/history", user_id, group_id
+            else:
+                yield "chatter", "token", "public", "anyone up for lunch later?", user_id, group_id
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def run(workload, allocations=False, metrics_path=None):
+    """
+    Run workload against a fresh Master. Return the results as a dict.
+    With metrics_path, Master is instrumented and its metrics are
+    written there in Prometheus format.
+    """
+    bot = FakeLineBotApi(record=False)
+    master = Master(bot, metrics=Metrics() if metrics_path else None)
+    latencies = {}                         # command -> list of nanoseconds
+    peak_bytes = {}                        # command -> list of bytes, with allocations only
+    clock = time.perf_counter_ns
+
+    if allocations:
+        tracemalloc.start()
+
+    def feed(events):
+        for command, token, channel, text, user_id, group_id in events:
+            if allocations:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+            start = clock()
+            master.query_reply(token, channel, text, user_id, group_id=group_id)
+            latencies.setdefault(command, []).append(clock() - start)
+            if allocations:
+                peak_bytes.setdefault(command, []).append(tracemalloc.get_traced_memory()[1] - baseline)
+
+    start = time.perf_counter()
+    feed(workload.setup_events())
+    feed(workload.traffic_events(master))
+    elapsed = time.perf_counter() - start
+
+    if allocations:
+        tracemalloc.stop()
+    if metrics_path:
+        master.dump_metrics(metrics_path)
+
+    events = sum(len(values) for values in latencies.values())
+    commands = {}
+    for command, values in sorted(latencies.items()):
+        values.sort()
+        commands[command] = {
+            "count": len(values),
+            "mean_us": sum(values) / len(values) / 1000,
+            "p50_us": percentile(values, 0.50) / 1000,
+            "p99_us": percentile(values, 0.99) / 1000,
+        }
+        if allocations:
+            commands[command]["peak_bytes_per_event"] = sum(peak_bytes[command]) / len(peak_bytes[command])
+
+    results = {
+        "workload": workload.as_dict(),
+        "python": sys.version.split()[0],
+        "events": events,
+        "seconds": elapsed,
+        "events_per_second": events / elapsed,
+        "reply_calls": bot.reply_calls,
+        "profile_calls": bot.profile_calls,
+        "commands": commands,
+    }
+    if allocations:
+        results["peak_bytes_per_event"] = (
+            sum(sum(values) for values in peak_bytes.values()) / events
+        )
+    return results
+
+def flood_events(workload, master, flooders, flood_ratio, seed=0):
+    """
+    Yield the traffic of workload, with spam bursts from the first
+    player of the first flooders groups after flood_ratio of its events:
+    a pasted alphabet, a scripted /add flood or /scoreboard spam.
+    """
+    generator = random.Random(seed)
+    for event in workload.traffic_events(master):
+        yield event
+        if generator.random() >= flood_ratio:
+            continue
+        group = generator.randrange(flooders)
+        group_id = "G%d" % group
+        user_id = "U%d-0" % group
+        burst = generator.choice(("alphabet", "add", "scoreboard"))
+        if burst == "alphabet":
+            for letter in string.ascii_uppercase:
+                yield "flood letter", "token", "public", letter, user_id, group_id
+        elif burst == "add":
+            for i in range(10):
+                yield "flood /add", "token", "private", "/add " + workload.phrase(generator), user_id, None
+        else:
+            for i in range(10):
+                yield "flood /scoreboard", "token", "public", "/scoreboard", user_id, group_id
+
+def run_flood(workload, flooders=5, flood_ratio=0.05, events_per_second=200.0):
+    """
+    Run workload under a synthetic flood, see flood_events, once without
+    and once with a RateLimiter of the default policies. Events are
+    spaced 1 / events_per_second apart on the limiter's clock. Return
+    CPU seconds, reply calls and events dropped of each run, with the
+    mean microseconds spent on a flood event and on any other.
+    """
+    results = {}
+    clock = time.perf_counter_ns
+    for name in ("unlimited", "limited"):
+        now = [0.0]
+        limiter = RateLimiter(clock=lambda: now[0]) if name == "limited" else None
+        bot = FakeLineBotApi(record=False)
+        master = Master(bot, rate_limiter=limiter)
+        spent = {True: [0, 0], False: [0, 0]}   # Flood event? -> [events, nanoseconds]
+        start = time.process_time()
+        for command, token, channel, text, user_id, group_id in itertools.chain(
+                workload.setup_events(), flood_events(workload, master, flooders, flood_ratio, workload.seed)):
+            now[0] += 1 / events_per_second
+            event_start = clock()
+            master.query_reply(token, channel, text, user_id, group_id=group_id)
+            totals = spent[command.startswith("flood")]
+            totals[0] += 1
+            totals[1] += clock() - event_start
+        results[name] = {
+            "events": spent[True][0] + spent[False][0],
+            "cpu_seconds": time.process_time() - start,
+            "flood_us_per_event": spent[True][1] / max(spent[True][0], 1) / 1000,
+            "other_us_per_event": spent[False][1] / max(spent[False][0], 1) / 1000,
+            "reply_calls": bot.reply_calls,
+            "dropped": limiter.dropped() if limiter is not None else 0,
+            "buckets": len(limiter) if limiter is not None else 0,
+        }
+    results["reply_calls_saved"] = results["unlimited"]["reply_calls"] - results["limited"]["reply_calls"]
+    return results
+
+def run_micro(phrase_length=200, players=500, number=2000):
+    """
+    Time the hot paths of Hangman in isolation. Return microseconds
+    per call of each.
+    """
+    generator = random.Random(0)
+    game = Hangman()
+    for player in range(players):
+        game.include_participant("U%d" % player, "Player %d" % player)
+    phrase = Workload(phrase_length=(phrase_length, phrase_length)).phrase(generator)
+    game.waiting_list.enqueue(phrase, "giver")
+    game.fetch_word()
+    for player in range(players):
+        game.scoreboard.add_score("U%d" % player, generator.randrange(100))
+    for letter in "AEIOU":
+        game.reveal_letter(letter)
+        game.history.record("U0", letter, 1, game.show_string, letter)
+
+    def per_call(statement):
+        return timeit.timeit(statement, number=number) / number * 1e6
+
+    return {
+        "update_show_string_us": per_call(game.update_show_string),
+        "reveal_and_render_us": per_call(lambda: (game.reveal_letter("E"), game.render_show_string())),
+        "get_scoreboard_us": per_call(game.get_scoreboard),
+        "get_scoreboard_uncached_us": per_call(lambda: (game.render_cache.clear(), game.get_scoreboard())),
+        "show_history_us": per_call(game.show_history),
+        "show_history_uncached_us": per_call(lambda: (game.render_cache.clear(), game.show_history())),
+        "add_score_us": per_call(lambda: game.scoreboard.add_score("U1", 1)),
+    }
+
+def run_memory(games=10000, players=5, seed=0):
+    """
+    Measure the Python heap held by resident games, each with players
+    joined, a word in play and a few guesses made, and by Messenger.
+    Return bytes per game and per Messenger.
+    """
+    generator = random.Random(seed)
+    workload = Workload()
+    phrases = [workload.phrase(generator) for game_number in range(games)]
+    names = ["Player %d" % player for player in range(players)]
+    user_ids = [["U%d-%d" % (game_number, player) for player in range(players)]
+                for game_number in range(games)]
+    
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    resident = []
+    for game_number in range(games):
+        game = Hangman()
+        for user_id, name in zip(user_ids[game_number], names):
+            game.include_participant(user_id, name)
+        game.add_word(phrases[game_number], user_ids[game_number][0])
+        game.continue_game()
+        for letter in "ETAOQ":
+            game.guess(user_ids[game_number][1], letter)
+        resident.append(game)
+    games_bytes = tracemalloc.get_traced_memory()[0] - start
+    
+    start = tracemalloc.get_traced_memory()[0]
+    messengers = [Messenger(None) for i in range(games)]
+    messenger_bytes = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    
+    return {
+        "games": games,
+        "bytes_per_game": games_bytes / games,
+        "bytes_per_messenger": messenger_bytes / len(messengers),
+    }
+
+def run_leaderboard(users=1000000, updates=200000, top=10, seed=0):
+    """
+    Fill a Leaderboard with users players, then time score updates from
+    random players and /leaderboard-sized top queries, all time and daily.
+    Return updates and queries per second.
+    """
+    generator = random.Random(seed)
+    user_ids = ["U%032x" % generator.getrandbits(128) for user in range(users)]
+    leaderboard = Leaderboard()
+    for user_id in user_ids:
+        leaderboard.add_score(user_id, generator.choice((1, 1, 1, 2, 10, 12)), user_id)
+    
+    scorers = [generator.choice(user_ids) for update in range(updates)]
+    start = time.perf_counter()
+    for user_id in scorers:
+        leaderboard.add_score(user_id, 1)
+    update_seconds = time.perf_counter() - start
+    
+    queries = updates // 10
+    start = time.perf_counter()
+    for query in range(queries):
+        leaderboard.top(top)
+        leaderboard.top(top, "daily")
+    query_seconds = time.perf_counter() - start
+    
+    return {
+        "users": users,
+        "updates_per_second": updates / update_seconds,
+        "top_queries_per_second": 2 * queries / query_seconds,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--groups", type=int, default=50)
+    parser.add_argument("--players", type=int, default=5)
+    parser.add_argument("--events", type=int, default=50000)
+    parser.add_argument("--phrase-length", type=int, nargs=2, default=(5, 40), metavar=("MIN", "MAX"))
+    parser.add_argument("--guess-ratio", type=float, default=0.5)
+    parser.add_argument("--word-guess-ratio", type=float, default=0.05)
+    parser.add_argument("--scoreboard-ratio", type=float, default=0.02)
+    parser.add_argument("--history-ratio", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--allocations", action="store_true",
+                        help="also measure peak bytes allocated per event (slower)")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="instrument Master and write its metrics to PATH in Prometheus format")
+    parser.add_argument("--no-micro", action="store_true", help="skip the Hangman micro-benchmarks")
+    parser.add_argument("--memory", action="store_true", help="also measure bytes per resident game")
+    parser.add_argument("--leaderboard", type=int, metavar="USERS",
+                        help="also time the global leaderboard with USERS players")
+    parser.add_argument("--flood", action="store_true",
+                        help="also run the workload under a spam flood, with and without rate limiting")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON to PATH ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    workload = Workload(args.groups, args.players, args.events, args.phrase_length,
+                        args.guess_ratio, args.word_guess_ratio, args.scoreboard_ratio,
+                        args.history_ratio, args.seed)
+    results = run(workload, allocations=args.allocations, metrics_path=args.metrics)
+    if not args.no_micro:
+        results["micro"] = run_micro()
+    if args.memory:
+        results["memory"] = run_memory()
+    if args.leaderboard:
+        results["leaderboard"] = run_leaderboard(args.leaderboard)
+    if args.flood:
+        results["flood"] = run_flood(workload)
+
+    if args.json == "-":
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+
+    print("%d events in %.2fs, %.0f events/s, %d reply calls" % (
+        results["events"], results["seconds"], results["events_per_second"], results["reply_calls"]))
+    print("%-12s %8s %10s %10s %10s" % ("command", "count", "mean us", "p50 us", "p99 us"))
+    for command, row in results["commands"].items():
+        print("%-12s %8d %10.1f %10.1f %10.1f" % (
+            command, row["count"], row["mean_us"], row["p50_us"], row["p99_us"]))
+    if args.allocations:
+        print("peak bytes per event: %.0f" % results["peak_bytes_per_event"])
+    for name, value in results.get("micro", {}).items():
+        print("%-24s %10.2f" % (name, value))
+    for name, value in results.get("memory", {}).items():
+        print("%-24s %10.0f" % (name, value))
+    for name, value in results.get("leaderboard", {}).items():
+        print("%-24s %10.0f" % (name, value))
+    if "flood" in results:
+        flood = results["flood"]
+        for name in ("unlimited", "limited"):
+            print("flood %-9s %6d events, %.2fs CPU, %5.1f us per flood event, %5.1f us per other, "
+                  "%d reply calls, %d dropped" % (
+                      name, flood[name]["events"], flood[name]["cpu_seconds"], flood[name]["flood_us_per_event"],
+                      flood[name]["other_us_per_event"], flood[name]["reply_calls"], flood[name]["dropped"]))
+        print("flood saved %d reply calls" % flood["reply_calls_saved"])
+
+if __name__ == "__main__":
+    main()
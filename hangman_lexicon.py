@@ -0,0 +1,145 @@
+import array
+import bisect
+import mmap
+import re
+import struct
+
+MAGIC = b"HLEX2\n"
+HEADER = struct.Struct("=6sI")             # Magic, number of words
+PREFIX_BYTES = 8
+
+# Letters only. Digits, punctuation and spaces split a phrase into words.
+WORD_PATTERN = re.compile(r"[^\W\d_]+")
+
+def prefix_of(word):
+    """
+    First PREFIX_BYTES bytes of word as an integer, ordered as the
+    bytes are. Words hold no NUL bytes, so zero padding sorts first.
+    """
+    return int.from_bytes(word[:PREFIX_BYTES].ljust(PREFIX_BYTES, b"\0"), "big")
+
+class LexiconWords:
+    """
+    Read-only sequence of the words of a lexicon file, as uppercase
+    UTF-8 bytes in sorted order, read straight out of the mapping.
+    """
+    def __init__(self, buffer, offsets, prefixes, words_start):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.prefixes = prefixes
+        self.words_start = words_start
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        start = self.words_start + self.offsets[index]
+        return self.buffer[start:self.words_start + self.offsets[index + 1]]
+
+class Lexicon:
+    """
+    Dictionary of valid words, memory-mapped from a file made by build.
+
+    The file holds a header, a table of word offsets, a table of word
+    prefixes and the words, uppercase and sorted by their UTF-8 bytes.
+    A prefix is the first 8 bytes of a word as an integer, so the prefix
+    table is sorted too and can be binary searched by bisect without any
+    Python-level comparison. Only words sharing the prefix of the word
+    looked up are then compared in full, usually none or one.
+
+    Everything is read from the mapping, nothing is loaded or copied per
+    process: every game and every worker process reading the same file
+    shares the same pages of the OS page cache.
+
+    Pickling a Lexicon keeps only its path, the file is mapped again on
+    unpickling.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.open()
+
+    def open(self):
+        with open(self.path, "rb") as lexicon_file:
+            self.mapping = mmap.mmap(lexicon_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = HEADER.unpack_from(self.mapping, 0)
+        if magic != MAGIC:
+            raise ValueError(self.path + " is not a lexicon file, see Lexicon.build")
+        offsets_start = HEADER.size
+        prefixes_start = offsets_start + (count + 1) * array.array("I").itemsize
+        words_start = prefixes_start + count * array.array("Q").itemsize
+        view = memoryview(self.mapping)
+        offsets = view[offsets_start:prefixes_start].cast("I")
+        prefixes = view[prefixes_start:words_start].cast("Q")
+        self.words = LexiconWords(self.mapping, offsets, prefixes, words_start)
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self.open()
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        key = word.upper().encode("utf-8")
+        words = self.words
+        prefix = prefix_of(key)
+        index = bisect.bisect_left(words.prefixes, prefix)
+        while index < len(words) and words.prefixes[index] == prefix:
+            if words[index] == key:
+                return True
+            index += 1
+        return False
+
+    def unknown_words(self, phrase):
+        """
+        Return the words of phrase not in the lexicon, in order.
+        """
+        return [word for word in WORD_PATTERN.findall(phrase) if word not in self]
+
+    @staticmethod
+    def build(source_path, target_path):
+        """
+        Make a lexicon file at target_path from a text file of words,
+        one per line, in any order and case. Return the word count.
+        """
+        with open(source_path, encoding="utf-8") as source:
+            words = sorted({line.strip().upper().encode("utf-8") for line in source if line.strip()})
+        offsets = array.array("I", [0])
+        for word in words:
+            offsets.append(offsets[-1] + len(word))
+        prefixes = array.array("Q", (prefix_of(word) for word in words))
+        with open(target_path, "wb") as target:
+            target.write(HEADER.pack(MAGIC, len(words)))
+            offsets.tofile(target)
+            prefixes.tofile(target)
+            for word in words:
+                target.write(word)
+        return len(words)
+
+if __name__ == "__main__":
+    # python hangman_lexicon.py build WORDS.txt LEXICON
+    # python hangman_lexicon.py bench LEXICON [LOOKUPS]
+    import random
+    import sys
+    import time
+    import tracemalloc
+
+    if sys.argv[1] == "build":
+        print("%d words" % Lexicon.build(sys.argv[2], sys.argv[3]))
+    elif sys.argv[1] == "bench":
+        lookups = int(sys.argv[3]) if len(sys.argv) > 3 else 1000000
+        tracemalloc.start()
+        lexicon = Lexicon(sys.argv[2])
+        opened_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        generator = random.Random(0)
+        known = [lexicon.words[generator.randrange(len(lexicon))].decode("utf-8") for i in range(1000)]
+        probes = [generator.choice(known) if i % 2 else generator.choice(known) + "Q" for i in range(lookups)]
+        start = time.perf_counter()
+        found = sum(1 for word in probes if word in lexicon)
+        elapsed = time.perf_counter() - start
+        print("%d words, %d bytes of Python heap after opening" % (len(lexicon), opened_bytes))
+        print("%d lookups (%d found) in %.2fs, %.0f lookups/s" % (lookups, found, elapsed, lookups / elapsed))
@@ -0,0 +1,123 @@
+import bisect
+
+# Upper bounds of histogram buckets. Anything above the last goes to +Inf.
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001,
+                   0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (16, 64, 256, 1024, 2000, 5000)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+class Histogram:
+    """
+    Histogram over fixed buckets. counts[i] is the number of observations
+    at most buckets[i] and above buckets[i-1], counts[-1] the rest.
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, fraction):
+        """
+        Upper bound of the bucket holding the given quantile, or None
+        if it is past the last bucket.
+        """
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank and seen:
+                return bound
+        return None
+
+class Metrics:
+    """
+    Registry of counters, gauges and fixed-bucket histograms.
+
+    Every metric is identified by a name and labels, a tuple of
+    (label, value) pairs. Metrics are made on first use. Master and
+    friends only touch a registry when given one, so leaving it out
+    costs one attribute check per event.
+    """
+    def __init__(self):
+        self.counters = {}                 # (name, labels) -> number
+        self.gauges = {}                   # (name, labels) -> number
+        self.histograms = {}               # (name, labels) -> Histogram
+
+    def increment(self, name, labels=(), amount=1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, labels=()):
+        self.gauges[(name, labels)] = value
+
+    def observe(self, name, value, labels=(), buckets=LATENCY_BUCKETS):
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            histogram = self.histograms[(name, labels)] = Histogram(buckets)
+        histogram.observe(value)
+
+    def render_text(self):
+        """
+        Return every metric as human-readable text, histograms
+        summarized by count, mean and bucketed p50/p99.
+        """
+        lines = []
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append("%s%s %s" % (name, format_labels(labels), value))
+        for (name, labels), value in sorted(self.gauges.items()):
+            lines.append("%s%s %s" % (name, format_labels(labels), value))
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            lines.append("%s%s count=%d mean=%.6g p50<=%s p99<=%s" % (
+                name, format_labels(labels), histogram.count,
+                histogram.sum / histogram.count if histogram.count else 0,
+                histogram.quantile(0.50), histogram.quantile(0.99)))
+        return "\n".join(lines) + "\n"
+
+    def render_prometheus(self):
+        """
+        Return every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+            typed = set()
+            for (name, labels), value in sorted(metrics.items()):
+                if name not in typed:
+                    lines.append("# TYPE %s %s" % (name, kind))
+                    typed.add(name)
+                lines.append("%s%s %s" % (name, format_labels(labels), value))
+        typed = set()
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            if name not in typed:
+                lines.append("# TYPE %s histogram" % name)
+                typed.add(name)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append("%s_bucket%s %d" % (name, format_labels(labels + (("le", repr(bound)),)), cumulative))
+            lines.append("%s_bucket%s %d" % (name, format_labels(labels + (("le", "+Inf"),)), histogram.count))
+            lines.append("%s_sum%s %s" % (name, format_labels(labels), histogram.sum))
+            lines.append("%s_count%s %d" % (name, format_labels(labels), histogram.count))
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path, format="prometheus"):
+        """
+        Write every metric to path, format being "prometheus" or "text".
+        """
+        if format == "prometheus":
+            rendered = self.render_prometheus()
+        else:
+            rendered = self.render_text()
+        with open(path, "w") as metrics_file:
+            metrics_file.write(rendered)
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('%s="%s"' % (label, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                          for label, value in labels) + "}"
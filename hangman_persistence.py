@@ -0,0 +1,311 @@
+import logging
+import os
+import pickle
+import threading
+
+from modular_hangman import Hangman, Master
+
+logger = logging.getLogger(__name__)
+
+class Journal:
+    """
+    Append-only log of mutating operations, one pickled
+    (method, group_id, args) record after another.
+
+    Records are written to a buffered file and are not synced on append,
+    so the event path never waits on the disk. Call flush, or let
+    PersistentMaster do it periodically from a background thread.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "ab")
+        self.records = 0                   # Records appended since opened
+
+    def append(self, method, group_id, args):
+        self.file.write(pickle.dumps((method, group_id, args), pickle.HIGHEST_PROTOCOL))
+        self.records += 1
+
+    def flush(self, fsync=True):
+        self.file.flush()
+        if fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    @staticmethod
+    def read(path):
+        """
+        Yield every complete record in the journal at path. A record cut
+        short by a crash ends the journal, and the file is truncated to
+        the last complete record so appending can resume safely.
+        """
+        with open(path, "r+b") as journal_file:
+            good_offset = 0
+            while True:
+                try:
+                    record = pickle.load(journal_file)
+                except EOFError:
+                    break
+                except (pickle.UnpicklingError, ValueError, AttributeError, IndexError):
+                    logger.warning("Truncating partial record in %s at %d", path, good_offset)
+                    journal_file.truncate(good_offset)
+                    break
+                good_offset = journal_file.tell()
+                yield record
+            if journal_file.seek(0, os.SEEK_END) > good_offset:
+                journal_file.truncate(good_offset)
+
+class JournaledHangman(Hangman):
+    """
+    Hangman that writes each mutating call to a journal before making it,
+    so the game can be rebuilt from a snapshot plus the journal.
+
+    Calls made while journal is None, e.g. during replay, are not written.
+    """
+    __slots__ = ("journal", "group_id")
+
+    def __init__(self, score_per_letter=1, score_per_word=10, keep_history_archive=False,
+                 max_words_per_giver=None):
+        Hangman.__init__(self, score_per_letter, score_per_word, keep_history_archive, max_words_per_giver)
+        self.journal = None
+        self.group_id = None
+
+    def __getstate__(self):
+        # The journal belongs to the running process, not to the snapshot.
+        state = Hangman.__getstate__(self)
+        state["journal"] = None
+        return state
+
+    def write_journal(self, method, args):
+        if self.journal is not None:
+            self.journal.append(method, self.group_id, args)
+
+    def include_participant(self, user_id, display_name):
+        self.write_journal("include_participant", (user_id, display_name))
+        return Hangman.include_participant(self, user_id, display_name)
+
+    def exclude_participant(self, user_id):
+        self.write_journal("exclude_participant", (user_id,))
+        return Hangman.exclude_participant(self, user_id)
+
+    def add_word(self, word, user_id):
+        self.write_journal("add_word", (word, user_id))
+        return Hangman.add_word(self, word, user_id)
+
+    def import_words(self, lines, user_id):
+        # Journal the words themselves, the file may be gone on replay.
+        lines = list(lines)
+        self.write_journal("import_words", (lines, user_id))
+        return Hangman.import_words(self, lines, user_id)
+
+    def guess(self, user_id, letter):
+        self.write_journal("guess", (user_id, letter))
+        return Hangman.guess(self, user_id, letter)
+
+    def guess_word(self, user_id, word):
+        self.write_journal("guess_word", (user_id, word))
+        return Hangman.guess_word(self, user_id, word)
+
+    def guess_batch(self, guesses):
+        self.write_journal("guess_batch", (list(guesses),))
+        return Hangman.guess_batch(self, guesses)
+
+    def continue_game(self):
+        self.write_journal("continue_game", ())
+        return Hangman.continue_game(self)
+
+class PersistentMaster(Master):
+    """
+    Master whose games, memberships and leaderboard survive a restart.
+
+    State lives in directory path as a snapshot, a pickle of all games,
+    memberships and the leaderboard if any, plus journal.<generation>, the
+    operations made since that snapshot. On start the snapshot is loaded
+    and its journal replayed, then any later generation. Every
+    snapshot_interval journal records the state is pickled and a new
+    journal generation started. The pickle is written as the new snapshot
+    by the background thread, and the journals it covers are deleted.
+
+    The journal is flushed and synced every fsync_interval seconds from a
+    background thread, never on the event path. At most that many seconds
+    of operations are lost on a crash. With fsync_interval 0 there is no
+    background thread, and snapshots are written on the event path.
+
+    Games must stay in memory, so game_store_path is not supported. The
+    lexicon and solver are not part of the snapshot, pass them again on
+    restart.
+    """
+    game_class = JournaledHangman
+
+    def __init__(self, line_bot_api, path, snapshot_interval=10000, fsync_interval=1.0, **kwargs):
+        Master.__init__(self, line_bot_api, **kwargs)
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self.journal_lock = threading.Lock()       # Guards swapping journals and pending_snapshot against the syncer
+        self.pending_snapshot = None               # (pickled state, journal paths it covers) the syncer is to write
+        self.covered_journals = []                 # Journal paths replayed on load, covered by the next snapshot
+        os.makedirs(path, exist_ok=True)
+
+        self.journal = None                # Until loaded, so replayed calls are not journaled again
+        self.generation = self.load()
+        self.journal = Journal(self.journal_path(self.generation))
+        for group_id, game in self.games.items():
+            self.attach(group_id, game)
+
+        self.stopped = threading.Event()
+        self.syncer = None
+        if fsync_interval:
+            self.syncer = threading.Thread(target=self.sync_periodically, args=(fsync_interval,), daemon=True)
+            self.syncer.start()
+
+    def snapshot_path(self):
+        return os.path.join(self.path, "snapshot")
+
+    def journal_path(self, generation):
+        return os.path.join(self.path, "journal." + str(generation))
+
+    def attach(self, group_id, game):
+        Master.attach(self, group_id, game)
+        if isinstance(game, JournaledHangman):
+            game.group_id = group_id
+            game.journal = self.journal
+
+    def load(self):
+        """
+        Load snapshot and replay its journal, then the journals of later
+        generations, left by a crash before their snapshot was written.
+        Return the generation of the last journal.
+        """
+        generation = 0
+        if os.path.exists(self.snapshot_path()):
+            with open(self.snapshot_path(), "rb") as snapshot_file:
+                state = pickle.load(snapshot_file)
+            generation = state["generation"]
+            self.games = state["games"]
+            self.memberships = state["memberships"]
+            if self.leaderboard is not None and state.get("leaderboard") is not None:
+                self.leaderboard = state["leaderboard"]
+            for group_id, game in self.games.items():
+                self.attach(group_id, game)
+
+        while os.path.exists(self.journal_path(generation)):
+            for method, group_id, args in Journal.read(self.journal_path(generation)):
+                try:
+                    self.replay(method, group_id, args)
+                except Exception:
+                    # The call failed the same way when it was journaled.
+                    logger.debug("Replayed %s on %r raised", method, group_id, exc_info=True)
+            if not os.path.exists(self.journal_path(generation + 1)):
+                break
+            self.covered_journals.append(self.journal_path(generation))
+            generation += 1
+        return generation
+
+    def replay(self, method, group_id, args):
+        if method == "add_game":
+            Master.add_game(self, group_id, self.game_class(*args))
+        elif method == "remove_game":
+            Master.remove_game(self, group_id)
+        elif method == "add_player_to_game":
+            Master.add_player_to_game(self, args[0], group_id)
+        elif method == "remove_player_from_game":
+            Master.remove_player_from_game(self, args[0], group_id)
+        else:
+            getattr(self.games[group_id], method)(*args)
+
+    def write_journal(self, method, group_id, args):
+        self.journal.append(method, group_id, args)
+
+    def query_reply(self, token, channel, received_text, user_id, **kwargs):
+        Master.query_reply(self, token, channel, received_text, user_id, **kwargs)
+        if self.journal.records >= self.snapshot_interval:
+            self.snapshot()
+
+    def snapshot(self):
+        """
+        Pickle every game and membership, then start a new journal
+        generation. The pickle is handed to the syncer to write, see
+        write_snapshot, or written at once if there is no syncer.
+        """
+        generation = self.generation + 1
+        state = {
+            "generation": generation,
+            "games": self.games,
+            "memberships": self.memberships,
+            "leaderboard": self.leaderboard,
+        }
+        data = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+
+        with self.journal_lock:
+            old_journal = self.journal
+            self.journal = Journal(self.journal_path(generation))
+            self.generation = generation
+            for group_id, game in self.games.items():
+                self.attach(group_id, game)
+            old_journal.close()
+            covered = self.covered_journals + [old_journal.path]
+            if self.pending_snapshot is not None:
+                # Not written yet. This one covers its journals too.
+                covered = self.pending_snapshot[1] + covered
+            self.pending_snapshot = (data, covered)
+            self.covered_journals = []
+        if self.syncer is None:
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        """
+        Write the pending snapshot, if any, and delete the journals
+        it covers.
+        """
+        with self.journal_lock:
+            pending, self.pending_snapshot = self.pending_snapshot, None
+        if pending is None:
+            return
+        data, covered = pending
+        temporary_path = self.snapshot_path() + ".tmp"
+        with open(temporary_path, "wb") as snapshot_file:
+            snapshot_file.write(data)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temporary_path, self.snapshot_path())
+        for journal_path in covered:
+            os.remove(journal_path)
+
+    def sync_periodically(self, interval):
+        while not self.stopped.wait(interval):
+            with self.journal_lock:
+                try:
+                    self.journal.flush()
+                except ValueError:
+                    # Closed by close() in the meantime.
+                    return
+            self.write_snapshot()
+
+    def close(self):
+        self.stopped.set()
+        if self.syncer is not None:
+            self.syncer.join()
+        self.write_snapshot()
+        with self.journal_lock:
+            self.journal.close()
+
+    def add_game(self, group_id, game):
+        if group_id not in self.games:
+            self.write_journal("add_game", group_id, (game.score_per_letter, game.score_per_word))
+            self.attach(group_id, game)
+        Master.add_game(self, group_id, game)
+
+    def remove_game(self, group_id):
+        if group_id in self.games:
+            self.write_journal("remove_game", group_id, ())
+        Master.remove_game(self, group_id)
+
+    def add_player_to_game(self, user_id, group_id):
+        self.write_journal("add_player_to_game", group_id, (user_id,))
+        Master.add_player_to_game(self, user_id, group_id)
+
+    def remove_player_from_game(self, user_id, group_id=None):
+        self.write_journal("remove_player_from_game", group_id, (user_id,))
+        Master.remove_player_from_game(self, user_id, group_id)
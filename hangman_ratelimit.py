@@ -0,0 +1,92 @@
+import time
+from collections import OrderedDict
+
+# Rules of each command class, as Master names them: the classes of
+# Master.classify for group chat, "private" for private chat. A rule is
+# (scope, rate, burst), a bucket per user_id or per group_id filling at
+# rate tokens a second up to burst. Classes without rules, e.g. /gameon,
+# are never limited.
+DEFAULT_POLICIES = {
+    "letter": [("user", 2.0, 10), ("group", 10.0, 40)],
+    "word": [("user", 0.5, 3), ("group", 2.0, 10)],
+    "game": [("user", 0.5, 5), ("group", 2.0, 10)],
+    "private": [("user", 0.2, 10)],
+}
+
+class RateLimiter:
+    """
+    Token buckets per user_id and per group_id, checked by Master before
+    an event reaches the game, see Master.dispatch.
+
+    An event needs a token in every bucket its command class has a rule
+    for, and is dropped if any of them is empty. Only then is a token
+    taken from each, so a user held back by the group limit doesn't lose
+    their own.
+
+    Each rule keeps its buckets in a dictionary by user_id or group_id,
+    oldest first. A bucket left alone for burst / rate seconds is full
+    again, no different from no bucket at all. Whenever a bucket is made,
+    up to sweep of the oldest ones of its rule are looked at: dropped if
+    that idle, else moved to the back. Expiry is O(1) amortized, checking
+    a bucket costs no reordering, and only active users and groups take
+    up memory.
+    """
+    def __init__(self, policies=None, clock=time.monotonic, sweep=2):
+        self.clock = clock
+        self.sweep = sweep
+        self.rules = {}                    # Command class -> [(by user?, rate, burst, buckets), ...]
+        for command, rules in (DEFAULT_POLICIES if policies is None else policies).items():
+            self.rules[command] = [(scope == "user", rate, burst, OrderedDict())
+                                   for scope, rate, burst in rules]
+        self.allowed = 0
+        self.limited = {}                  # Command class -> events dropped
+
+    def __len__(self):
+        return sum(len(rule[3]) for rules in self.rules.values() for rule in rules)
+
+    def allow(self, command, user_id, group_id=None):
+        """
+        Take a token for an event of class command from user_id in
+        group_id. Return whether the event may go on.
+        """
+        rules = self.rules.get(command)
+        if rules is None:
+            return True
+        now = self.clock()
+        checked = []
+        for by_user, rate, burst, buckets in rules:
+            key = user_id if by_user else group_id
+            if key is None:
+                # Private chat has no group.
+                continue
+            bucket = buckets.get(key)              # [tokens, refilled at]
+            if bucket is None:
+                self.expire(buckets, burst / rate, now)
+                bucket = buckets[key] = [burst, now]
+            else:
+                tokens = bucket[0] + (now - bucket[1]) * rate
+                bucket[0] = tokens if tokens < burst else burst
+                bucket[1] = now
+                if bucket[0] < 1:
+                    self.limited[command] = self.limited.get(command, 0) + 1
+                    return False
+            checked.append(bucket)
+        for bucket in checked:
+            bucket[0] -= 1
+        self.allowed += 1
+        return True
+
+    def expire(self, buckets, idle_after, now):
+        """
+        Look at up to sweep of the oldest buckets: drop them if idle
+        for idle_after seconds, else move them to the back.
+        """
+        for i in range(min(self.sweep, len(buckets))):
+            key = next(iter(buckets))
+            if now - buckets[key][1] >= idle_after:
+                del buckets[key]
+            else:
+                buckets.move_to_end(key)
+
+    def dropped(self):
+        return sum(self.limited.values())
@@ -0,0 +1,249 @@
+"""
+Record live Master traffic to an event log, and replay it offline.
+
+RecordingMaster logs every query_reply with the profile answers and the
+replies it caused, and every flush_pushes with the pushes it made.
+Replaying the log feeds the same events through a fresh Master against
+a fake bot, as fast as it goes, and reports every event whose replies
+differ from the recorded ones, e.g.
+
+    python hangman_replay.py events.log --workers 4
+"""
+import argparse
+import multiprocessing
+import time
+
+from fake_line_bot import FakeLineBotApi
+from hangman_persistence import Journal
+from hangman_shard import shard_of
+from modular_hangman import Master, MembershipIndex
+
+class RecordingLineBotApi:
+    """
+    Proxy in front of a LineBotApi, writing every profile answer, reply
+    and push to log as it passes. A failed get_profile is logged
+    with None as the display name before the error goes on.
+    """
+    def __init__(self, line_bot_api, log):
+        self.bot = line_bot_api
+        self.log = log
+
+    def get_profile(self, user_id):
+        try:
+            profile = self.bot.get_profile(user_id)
+        except Exception:
+            self.log.append("profile", None, (user_id, None))
+            raise
+        self.log.append("profile", None, (user_id, profile.display_name))
+        return profile
+
+    def reply_message(self, reply_token, messages):
+        self.log.append("reply", None, (reply_token, [message.text for message in messages]))
+        return self.bot.reply_message(reply_token, messages)
+
+    def push_message(self, to, messages):
+        self.log.append("push", None, (to, [message.text for message in messages]))
+        return self.bot.push_message(to, messages)
+
+    def leave_group(self, group_id):
+        self.log.append("leave", group_id, ())
+        return self.bot.leave_group(group_id)
+
+    def __getattr__(self, name):
+        return getattr(self.bot, name)
+
+class RecordingMaster(Master):
+    """
+    Master writing every query_reply to an append-only event log at
+    path, followed by the profile answers and replies it caused, or the
+    error it raised, and every flush_pushes followed by its pushes. The
+    log is a Journal: buffered, flushed on close or flush, and cut back
+    to the last whole record if the process dies.
+    """
+    def __init__(self, line_bot_api, path, **kwargs):
+        self.log = Journal(path)
+        Master.__init__(self, RecordingLineBotApi(line_bot_api, self.log), **kwargs)
+
+    def query_reply(self, token, channel, received_text, user_id, **kwargs):
+        self.log.append("query_reply", kwargs.get("group_id"), (token, channel, received_text, user_id, kwargs))
+        try:
+            return Master.query_reply(self, token, channel, received_text, user_id, **kwargs)
+        except Exception as error:
+            self.log.append("error", kwargs.get("group_id"), (type(error).__name__,))
+            raise
+
+    def flush_pushes(self):
+        self.log.append("flush_pushes", None, ())
+        return Master.flush_pushes(self)
+
+    def flush(self):
+        self.log.flush(fsync=False)
+
+    def close(self):
+        self.log.close()
+
+class ReplayLineBotApi(FakeLineBotApi):
+    """
+    Fake bot answering get_profile as recorded. A display name of None
+    stands for a failed get_profile, and raises LookupError.
+    """
+    def get_profile(self, user_id):
+        if user_id in self.display_names and self.display_names[user_id] is None:
+            self.profile_calls += 1
+            raise LookupError("Recorded get_profile failure for " + str(user_id))
+        return FakeLineBotApi.get_profile(self, user_id)
+
+def read_events(path):
+    """
+    Return the events of the log at path, in order, each a list of
+    [token, channel, received_text, user_id, kwargs, profiles, outcome].
+    profiles is the {user_id: display_name} answered while handling it,
+    outcome its replies as (token, texts), its pushes as ("push", to,
+    texts) and its error as ("error", name). A flush_pushes is an event
+    of channel "flush_pushes" and no token, text or user.
+    """
+    events = []
+    for method, group_id, args in Journal.read(path):
+        if method == "query_reply":
+            events.append(list(args) + [{}, []])
+        elif method == "flush_pushes":
+            events.append([None, "flush_pushes", None, None, {}, {}, []])
+        elif not events:
+            continue
+        elif method == "profile":
+            events[-1][5][args[0]] = args[1]
+        elif method == "reply":
+            events[-1][6].append((args[0], args[1]))
+        elif method == "push":
+            events[-1][6].append(("push", args[0], args[1]))
+        elif method == "error":
+            events[-1][6].append(("error", args[0]))
+    return events
+
+def partition(events, workers):
+    """
+    Split events, numbered, into workers lists that can be replayed
+    apart. Group chat goes by group_id. Private chat goes with the group
+    Master has the user playing in, so /add lands in the right game:
+    games and their participants are followed through /gameon, /join,
+    /quit, /gameoff and /goaway, and memberships kept in a
+    MembershipIndex, first /join wins, as Master does. Every list gets
+    every flush_pushes.
+    """
+    parts = [[] for worker in range(workers)]
+    master = Master(None)                  # For classify and keywords only
+    game_class = master.game_class
+    participants = {}                      # group_id -> set of user_id, for every group with a game
+    memberships = MembershipIndex()
+    for index, event in enumerate(events):
+        token, channel, received_text, user_id, kwargs = event[:5]
+        group_id = kwargs.get("group_id")
+        if channel == "flush_pushes":
+            for part in parts:
+                part.append((index, event))
+            continue
+        if channel == "public":
+            command = master.classify(channel, received_text)
+            if command == "add_game":
+                participants.setdefault(group_id, set())
+            elif command in ("remove_game", "leave"):
+                if participants.pop(group_id, None) is not None:
+                    memberships.remove_group(group_id)
+            elif group_id in participants:
+                players = participants[group_id]
+                if received_text == game_class.keyword_join and user_id not in players:
+                    players.add(user_id)
+                    memberships.add(user_id, group_id)
+                elif received_text == game_class.keyword_unjoin and user_id in players:
+                    players.discard(user_id)
+                    memberships.remove(user_id, group_id)
+            key = group_id
+        else:
+            key = memberships.get(user_id, user_id)
+        parts[shard_of(key, workers)].append((index, event))
+    return parts
+
+def replay_events(numbered_events, master_class=Master, master_kwargs=None):
+    """
+    Feed numbered_events, (index, event) pairs, through a fresh
+    master_class. Return the number of events, seconds taken, the
+    mismatches, (index, recorded outcome, replayed outcome) for every
+    event whose outcome differs, and the replayed outcome of every
+    flush_pushes by index. Those are compared by replay, once the pushes
+    of every list are in.
+    """
+    bot = ReplayLineBotApi()
+    master = master_class(bot, **(master_kwargs or {}))
+    mismatches = []
+    flushed = {}
+    start = time.perf_counter()
+    for index, event in numbered_events:
+        token, channel, received_text, user_id, kwargs, profiles, outcome = event
+        bot.display_names.update(profiles)
+        try:
+            if channel == "flush_pushes":
+                master.flush_pushes()
+            else:
+                master.query_reply(token, channel, received_text, user_id, **kwargs)
+        except Exception as error:
+            bot.replies.append(("error", type(error).__name__))
+        replayed = [reply if reply[0] == "error" else (reply[0], [message.text for message in reply[1]])
+                    for reply in bot.replies]
+        replayed.extend(("push", to, [message.text for message in messages]) for to, messages in bot.pushes)
+        del bot.replies[:]
+        del bot.pushes[:]
+        if channel == "flush_pushes":
+            flushed[index] = replayed
+        elif replayed != outcome:
+            mismatches.append((index, outcome, replayed))
+    return len(numbered_events), time.perf_counter() - start, mismatches, flushed
+
+def replay(path, workers=1, master_class=Master, master_kwargs=None):
+    """
+    Replay the log at path, across workers processes if more than one.
+    Return the results as a dict, mismatches sorted by event.
+    """
+    events = read_events(path)
+    start = time.perf_counter()
+    if workers == 1:
+        results = [replay_events(list(enumerate(events)), master_class, master_kwargs)]
+    else:
+        parts = partition(events, workers)
+        with multiprocessing.get_context().Pool(workers) as pool:
+            results = pool.starmap(replay_events, [(part, master_class, master_kwargs) for part in parts])
+    elapsed = time.perf_counter() - start
+
+    mismatches = [mismatch for result in results for mismatch in result[2]]
+    # Every list pushes its own groups, in no set order against the others.
+    for index in results[0][3]:
+        replayed = [push for result in results for push in result[3][index]]
+        if sorted(replayed) != sorted(events[index][6]):
+            mismatches.append((index, events[index][6], replayed))
+    mismatches.sort()
+    return {
+        "events": len(events),
+        "workers": workers,
+        "seconds": elapsed,
+        "events_per_second": len(events) / elapsed if elapsed else 0,
+        "mismatches": mismatches,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("log", help="event log written by RecordingMaster")
+    parser.add_argument("--workers", type=int, default=1, help="replay groups across this many processes")
+    parser.add_argument("--batch-window", type=float, default=0,
+                        help="Master batch_window. Batching depends on timing, expect mismatches.")
+    parser.add_argument("--show", type=int, default=10, help="print at most this many mismatches")
+    args = parser.parse_args(argv)
+
+    results = replay(args.log, args.workers, master_kwargs={"batch_window": args.batch_window})
+    print("%d events in %.2fs with %d workers, %.0f events/s, %d mismatches" % (
+        results["events"], results["seconds"], results["workers"],
+        results["events_per_second"], len(results["mismatches"])))
+    for index, recorded, replayed in results["mismatches"][:args.show]:
+        print("event %d\n  recorded: %r\n  replayed: %r" % (index, recorded, replayed))
+    return 1 if results["mismatches"] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
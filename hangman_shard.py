@@ -0,0 +1,188 @@
+import logging
+import multiprocessing
+import zlib
+
+from modular_hangman import Master
+
+logger = logging.getLogger(__name__)
+
+def shard_of(group_id, shards):
+    """
+    Shard owning group_id. Stable across processes, unlike hash().
+    """
+    return zlib.crc32(str(group_id).encode("utf-8")) % shards
+
+class ShardMaster(Master):
+    """
+    Master running in one shard process, owning the games of the groups
+    that hash to it.
+
+    Memberships are also written to routing, the user_id -> shard table
+    shared by all shards and the front end, so private chat from a user
+    can be routed to the shard of the group the user plays in. A user
+    plays in one group at a time across all shards: the first shard to
+    claim user_id in routing wins.
+    """
+    def __init__(self, line_bot_api, shard, routing, **kwargs):
+        Master.__init__(self, line_bot_api, **kwargs)
+        self.shard = shard
+        self.routing = routing
+
+    def add_player_to_game(self, user_id, group_id):
+        if self.routing.setdefault(user_id, self.shard) == self.shard:
+            Master.add_player_to_game(self, user_id, group_id)
+
+    def remove_player_from_game(self, user_id, group_id=None):
+        if user_id in self.memberships:
+            Master.remove_player_from_game(self, user_id, group_id)
+            if user_id not in self.memberships:
+                self.routing.pop(user_id, None)
+
+    def remove_game(self, group_id):
+        for user_id in list(self.memberships.members(group_id)):
+            self.routing.pop(user_id, None)
+        Master.remove_game(self, group_id)
+
+def run_shard(shard, line_bot_api_factory, routing, events, results, master_kwargs):
+    """
+    Body of a shard process. Handles events until it receives None.
+    """
+    line_bot_api = line_bot_api_factory()
+    master = ShardMaster(line_bot_api, shard, routing, **master_kwargs)
+    while True:
+        event = events.get()
+        if event is None:
+            break
+        if event[0] == "event":
+            token, channel, received_text, user_id, kwargs = event[1]
+            try:
+                master.query_reply(token, channel, received_text, user_id, **kwargs)
+            except Exception:
+                logger.exception("Shard %d failed to handle event", shard)
+        elif event[0] == "report":
+            results.put({
+                "shard": shard,
+                "games": len(master.games),
+                "members": len(master.memberships),
+                "replies": len(getattr(line_bot_api, "replies", ())),
+                "waiting": {group_id: list(game.waiting_list) for group_id, game in master.games.items()},
+            })
+
+class ShardedMaster:
+    """
+    Front end spreading Master over several processes, so throughput is
+    not bound to one core by the GIL.
+
+    Group chat is handed to the shard shard_of(group_id). Private chat is
+    handed to the shard found for user_id in the shared routing table,
+    and dropped when the user plays nowhere, as Master would. Each shard
+    replies through its own line_bot_api, made in the shard process by
+    line_bot_api_factory, which must be picklable.
+
+    query_reply only queues the event. A private message sent right after
+    /join may arrive before the join is routed, and is then dropped.
+    """
+    def __init__(self, line_bot_api_factory, shards=4, **master_kwargs):
+        self.shards = shards
+        self.context = multiprocessing.get_context()
+        self.manager = self.context.Manager()
+        self.routing = self.manager.dict()     # user_id -> shard
+        self.results = self.context.Queue()
+        self.queues = []
+        self.processes = []
+        for shard in range(shards):
+            events = self.context.Queue()
+            process = self.context.Process(
+                target=run_shard,
+                args=(shard, line_bot_api_factory, self.routing, events, self.results, master_kwargs),
+                daemon=True
+            )
+            process.start()
+            self.queues.append(events)
+            self.processes.append(process)
+
+    def query_reply(self, token, channel, received_text, user_id, **kwargs):
+        if channel == "public":
+            shard = shard_of(kwargs.get("group_id"), self.shards)
+        else:
+            shard = self.routing.get(user_id)
+            if shard is None:
+                return
+        self.queues[shard].put(("event", (token, channel, received_text, user_id, kwargs)))
+
+    def report(self):
+        """
+        Wait for every shard to handle its queued events, then return
+        a report of each, sorted by shard: its number of games, members
+        and replies, and the waiting words of each of its games.
+        """
+        for events in self.queues:
+            events.put(("report",))
+        return sorted((self.results.get() for shard in range(self.shards)), key=lambda r: r["shard"])
+
+    def close(self):
+        for events in self.queues:
+            events.put(None)
+        for process in self.processes:
+            process.join()
+        self.manager.shutdown()
+
+if __name__ == "__main__":
+    # Local multi-process harness, with fake bots in every shard.
+    import random
+    import sys
+    import time
+
+    from fake_line_bot import FakeLineBotApi
+
+    shards = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    groups = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    events = int(sys.argv[3]) if len(sys.argv) > 3 else 100000
+    generator = random.Random(0)
+
+    master = ShardedMaster(FakeLineBotApi, shards=shards)
+    for group_id in range(groups):
+        master.query_reply("token", "public", "/gameon", "host", group_id="G" + str(group_id))
+        for player in range(5):
+            master.query_reply("token", "public", "/join", "U%d-%d" % (group_id, player), group_id="G" + str(group_id))
+    master.report()
+
+    # Private chat goes to the shard of the user's group, through routing.
+    for group_id in range(groups):
+        for player in range(5):
+            master.query_reply("token", "private", "/add WORD OF U%d-%d" % (group_id, player), "U%d-%d" % (group_id, player))
+    for row in master.report():
+        for group_id, words in row["waiting"].items():
+            assert shard_of(group_id, shards) == row["shard"], (group_id, row["shard"])
+            number = group_id[1:]
+            assert words == ["WORD OF U%s-%d" % (number, player) for player in range(5)], (group_id, words)
+    assert sum(len(row["waiting"]) for row in master.report()) == groups
+
+    # /quit and /gameoff release routing, later private chat is dropped.
+    for group_id in range(groups):
+        master.query_reply("token", "public", "/quit", "U%d-4" % group_id, group_id="G" + str(group_id))
+        if group_id % 10 == 0:
+            master.query_reply("token", "public", "/gameoff", "host", group_id="G" + str(group_id))
+    master.report()
+    routing = dict(master.routing)
+    for group_id in range(groups):
+        for player in range(5):
+            user_id = "U%d-%d" % (group_id, player)
+            if player == 4 or group_id % 10 == 0:
+                assert user_id not in routing, user_id
+            else:
+                assert routing[user_id] == shard_of("G" + str(group_id), shards), user_id
+        master.query_reply("token", "private", "/add DROPPED WORD", "U%d-4" % group_id)
+    for row in master.report():
+        assert all(len(words) == 5 for words in row["waiting"].values()), row["shard"]
+    print("private chat routed to %d groups, released by /quit and /gameoff" % groups)
+
+    start = time.perf_counter()
+    for event in range(events):
+        group_id = generator.randrange(groups)
+        master.query_reply("token", "public", "/scoreboard", "U%d-0" % group_id, group_id="G" + str(group_id))
+    for row in master.report():
+        print({key: value for key, value in row.items() if key != "waiting"})
+    elapsed = time.perf_counter() - start
+    print("%d shards: %.0f events/s" % (shards, events / elapsed))
+    master.close()
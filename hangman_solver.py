@@ -0,0 +1,286 @@
+import os
+
+import numpy as np
+
+LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+CODES = {letter: code for code, letter in enumerate(LETTERS)}
+
+def presence_of(words):
+    """
+    Bitmask of the letters in each row of words, an (n, length) array
+    of letter codes, bit code set for every letter in the row.
+    """
+    presence = np.zeros(len(words), dtype=np.uint32)
+    for column in range(words.shape[1]):
+        presence |= np.left_shift(np.uint32(1), words[:, column].astype(np.uint32))
+    return presence
+
+# BYTE_BITS[b, i] is bit i of byte b.
+BYTE_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1, bitorder="little").astype(np.int64)
+
+def count_letters(presence):
+    """
+    Return how many of the bitmasks in presence have each of the 26
+    letter bits set. Each byte of the bitmasks is tallied by value with
+    bincount, then the tallies are spread over the bits of the byte.
+    """
+    columns = np.ascontiguousarray(presence, dtype="<u4").view(np.uint8).reshape(-1, 4)
+    counts = [np.bincount(columns[:, byte], minlength=256) @ BYTE_BITS for byte in range(4)]
+    return np.concatenate(counts)[:26]
+
+class Solver:
+    """
+    Picks the best next letter for a Hangman pattern, for /hint and for
+    bot players.
+
+    The candidate words are kept in a directory made by build, one array
+    per word length: length-N.npy holds the words of N letters as rows of
+    letter codes 0-25, presence-N.npy the bitmask of letters in each.
+    The arrays are memory-mapped, so like a Lexicon they are shared by
+    every game and worker process, and a Solver pickles as its path.
+
+    A pattern is narrowed by comparing whole columns at once: known
+    positions must hold their letter, unknown ones must hold none of the
+    excluded letters (the ones revealed elsewhere and the ones missed).
+    The best letter is the one found in the most candidates, counted over
+    the presence bitmasks.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.open()
+
+    def open(self):
+        self.words = {}                    # length -> (n, length) uint8 array of letter codes
+        self.presence = {}                 # length -> (n,) uint32 array of letter bitmasks
+        self.full_counts = {}              # length -> letter_counts of every word, made on first use
+        for name in os.listdir(self.path):
+            if name.startswith("length-") and name.endswith(".npy"):
+                length = int(name[len("length-"):-len(".npy")])
+                self.words[length] = np.load(os.path.join(self.path, name), mmap_mode="r")
+                self.presence[length] = np.load(os.path.join(self.path, "presence-%d.npy" % length),
+                                                mmap_mode="r")
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self.open()
+
+    def __len__(self):
+        return sum(len(words) for words in self.words.values())
+
+    def candidates(self, pattern, excluded, within=None):
+        """
+        Return the indices of the words matching pattern, a tuple of
+        letters with None for every unknown one, among the words of its
+        length. excluded is the bitmask of letters no unknown position
+        can hold. within, indices from an earlier call on a looser
+        pattern of the same length, narrows only those instead of every
+        word.
+        """
+        words = self.words.get(len(pattern))
+        if words is None:
+            return np.zeros(0, dtype=np.intp)
+        indices = np.arange(len(words)) if within is None else within
+        known = [position for position, letter in enumerate(pattern) if letter is not None]
+        unknown = [position for position, letter in enumerate(pattern) if letter is None]
+        revealed = 0
+        for position in known:
+            revealed |= 1 << CODES[pattern[position]]
+
+        # Cheapest test first, each on what the one before kept. A missed
+        # letter is nowhere in the word, one bitmask test per word.
+        missed = excluded & ~revealed
+        if missed:
+            indices = indices[(self.presence[len(pattern)][indices] & missed) == 0]
+        if known:
+            codes = np.array([CODES[pattern[position]] for position in known], dtype=np.uint8)
+            indices = indices[(words[indices][:, known] == codes).all(axis=1)]
+        if unknown and excluded & revealed:
+            # A revealed letter shows in every position it holds.
+            excluded_codes = np.array([(excluded & revealed) >> code & 1 for code in range(26)], dtype=bool)
+            indices = indices[~excluded_codes[words[indices][:, unknown]].any(axis=1)]
+        return indices
+
+    def session(self):
+        return SolverSession()
+
+    def letter_counts(self, length, indices):
+        """
+        Return the number of candidates holding each letter, as an array
+        of 26 counts.
+        """
+        if len(indices) == len(self.words[length]):
+            # Nothing narrowed yet, as for the first hint of every word.
+            counts = self.full_counts.get(length)
+            if counts is None:
+                counts = self.full_counts[length] = count_letters(self.presence[length])
+            return counts
+        return count_letters(self.presence[length][indices])
+
+    def best_letter(self, active_word, letter_states, missed_letters=(), session=None):
+        """
+        Return the best letter to guess next in a game, or None if no
+        word of the lexicon fits.
+
+        Only what players can see is used: the letters of active_word
+        revealed in letter_states, the length and punctuation of each word,
+        and the missed letters. Every word of a phrase is narrowed on its
+        own, and a letter scores the fraction of candidates holding it,
+        summed over the words. Pass the same SolverSession for every call
+        on one active_word to narrow from the previous candidates.
+        """
+        excluded = 0
+        for letter in missed_letters:
+            if letter in CODES:
+                excluded |= 1 << CODES[letter]
+        for letter, revealed in letter_states.items():
+            if revealed and letter in CODES:
+                excluded |= 1 << CODES[letter]
+
+        scores = np.zeros(26)
+        for position, token in enumerate(tokens_of(active_word)):
+            if not all(letter in CODES for letter in token):
+                # No such word in the lexicon.
+                continue
+            pattern = tuple(letter if letter_states.get(letter, True) else None for letter in token)
+            if None not in pattern:
+                continue
+            if session is None:
+                indices = self.candidates(pattern, excluded)
+            else:
+                indices = session.candidates(self, position, pattern, excluded)
+            if len(indices):
+                scores += self.letter_counts(len(pattern), indices) / len(indices)
+
+        for code in range(26):
+            if excluded >> code & 1:
+                scores[code] = 0
+        if not scores.any():
+            return None
+        return LETTERS[int(scores.argmax())]
+
+    @staticmethod
+    def build(words, target_path):
+        """
+        Make a solver directory at target_path from words, e.g. a Lexicon's
+        words or the lines of a word list. Words are uppercased, and words
+        not made only of the letters A to Z are skipped. Return the number
+        of words kept.
+        """
+        by_length = {}
+        for word in words:
+            if isinstance(word, bytes):
+                word = word.decode("utf-8")
+            word = word.strip().upper()
+            if word and all(letter in CODES for letter in word):
+                by_length.setdefault(len(word), set()).add(word)
+
+        os.makedirs(target_path, exist_ok=True)
+        kept = 0
+        for length, length_words in by_length.items():
+            rows = np.frombuffer("".join(sorted(length_words)).encode("ascii"), dtype=np.uint8)
+            rows = (rows - ord("A")).reshape(-1, length)
+            np.save(os.path.join(target_path, "length-%d.npy" % length), rows)
+            np.save(os.path.join(target_path, "presence-%d.npy" % length), presence_of(rows))
+            kept += len(rows)
+        return kept
+
+class SolverSession:
+    """
+    Candidates of each word of one active_word, so that every call of
+    Solver.best_letter narrows the previous candidates as guesses come
+    in instead of the whole lexicon. Start a new one for every word.
+
+    Only a cache: it is emptied when pickled.
+    """
+    def __init__(self):
+        self.narrowed = {}                 # Word position in phrase -> (pattern, excluded, indices)
+
+    def __getstate__(self):
+        return {"narrowed": {}}
+
+    def candidates(self, solver, position, pattern, excluded):
+        previous = self.narrowed.get(position)
+        within = None
+        if previous is not None and narrows(previous[0], previous[1], pattern, excluded):
+            within = previous[2]
+        indices = solver.candidates(pattern, excluded, within)
+        self.narrowed[position] = (pattern, excluded, indices)
+        return indices
+
+def narrows(old_pattern, old_excluded, pattern, excluded):
+    """
+    Whether pattern and excluded only add to old_pattern and old_excluded,
+    so that their candidates are among the old ones.
+    """
+    if len(old_pattern) != len(pattern) or old_excluded & ~excluded:
+        return False
+    return all(old is None or old == new for old, new in zip(old_pattern, pattern))
+
+def tokens_of(phrase):
+    """
+    Split phrase into its words, the runs of letters.
+    """
+    tokens = []
+    token = ""
+    for char in phrase:
+        if char.isalpha():
+            token += char
+        elif token:
+            tokens.append(token)
+            token = ""
+    if token:
+        tokens.append(token)
+    return tokens
+
+if __name__ == "__main__":
+    # python hangman_solver.py build WORDS.txt|LEXICON SOLVER_DIR
+    # python hangman_solver.py bench SOLVER_DIR [WORDS_TO_PLAY]
+    import random
+    import sys
+    import time
+
+    if sys.argv[1] == "build":
+        with open(sys.argv[2], "rb") as source:
+            is_lexicon = source.read(6) == b"HLEX2\n"
+        if is_lexicon:
+            from hangman_lexicon import Lexicon
+            print("%d words" % Solver.build(Lexicon(sys.argv[2]).words, sys.argv[3]))
+        else:
+            with open(sys.argv[2], encoding="utf-8") as source:
+                print("%d words" % Solver.build(source, sys.argv[3]))
+    elif sys.argv[1] == "bench":
+        # A bot player guessing its way through random words of the lexicon.
+        solver = Solver(sys.argv[2])
+        games = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+        generator = random.Random(0)
+        lengths = [length for length in solver.words for i in range(len(solver.words[length]))]
+        first_timings = []                 # First hint of a word, narrowing every word of its length
+        timings = []                       # Later hints, narrowing the previous candidates
+        misses = 0
+        for game in range(games):
+            length = generator.choice(lengths)
+            row = solver.words[length][generator.randrange(len(solver.words[length]))]
+            word = "".join(LETTERS[code] for code in row)
+            letter_states = {letter: False for letter in word}
+            missed_letters = set()
+            session = SolverSession()
+            hints = first_timings
+            while not all(letter_states.values()):
+                start = time.perf_counter()
+                letter = solver.best_letter(word, letter_states, missed_letters, session)
+                hints.append(time.perf_counter() - start)
+                hints = timings
+                if letter in letter_states:
+                    letter_states[letter] = True
+                else:
+                    missed_letters.add(letter)
+                    misses += 1
+        print("%d words, %d games, %.2f misses per game" % (len(solver), games, misses / games))
+        for name, values in (("first hints", first_timings), ("later hints", timings)):
+            values.sort()
+            print("%d %s: mean %.3f ms, p50 %.3f ms, p99 %.3f ms" % (
+                len(values), name, sum(values) / len(values) * 1000,
+                values[len(values) // 2] * 1000, values[int(len(values) * 0.99)] * 1000))
@@ -0,0 +1,266 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from hangman_ratelimit import RateLimiter
+from modular_hangman import Leaderboard, Master, ProfileCache
+
+class LockedProfileCache(ProfileCache):
+    """
+    ProfileCache safe to share between threads. The cache itself is
+    guarded by a lock, get_profile is not, so a slow profile fetch
+    doesn't hold up lookups of other users.
+    """
+    def __init__(self, line_bot_api, **kwargs):
+        ProfileCache.__init__(self, line_bot_api, **kwargs)
+        self.lock = threading.Lock()
+
+    def lookup(self, user_id):
+        with self.lock:
+            return ProfileCache.lookup(self, user_id)
+
+    def store(self, user_id, display_name, ttl=None):
+        with self.lock:
+            return ProfileCache.store(self, user_id, display_name, ttl)
+
+class LockedLeaderboard(Leaderboard):
+    """
+    Leaderboard safe to share between threads, as the games of every
+    group feed it at once.
+    """
+    def __init__(self, **kwargs):
+        Leaderboard.__init__(self, **kwargs)
+        self.lock = threading.Lock()
+
+    def add_score(self, user_id, amount, display_name=None):
+        with self.lock:
+            Leaderboard.add_score(self, user_id, amount, display_name)
+
+    def top(self, k, window=None):
+        with self.lock:
+            return Leaderboard.top(self, k, window)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+class LockedRateLimiter(RateLimiter):
+    """
+    RateLimiter safe to share between threads. A user's buckets are
+    checked from the lock of whichever group they write in.
+    """
+    def __init__(self, **kwargs):
+        RateLimiter.__init__(self, **kwargs)
+        self.lock = threading.Lock()
+
+    def allow(self, command, user_id, group_id=None):
+        with self.lock:
+            return RateLimiter.allow(self, command, user_id, group_id)
+
+class ThreadedMaster(Master):
+    """
+    Master that can be called from many threads at once, for deployments
+    that stay on the synchronous API.
+
+    Each group has a lock, held while its game handles an event, so a game
+    never sees two events interleaved while different groups run in
+    parallel. Private chat takes the lock of the group the user plays in.
+    memberships is guarded by membership_stripes locks, picked by user_id,
+    so joins in different groups rarely wait on each other.
+
+    No API call is made under a lock. A profile the game is going to need
+    is fetched before the group lock is taken, and replies and leave_group
+    calls are collected while it is held and made once it is released.
+
+    query_reply is safe to call from any thread, e.g. from the threads of
+    a WSGI server. submit runs it on a pool of max_workers threads instead
+    and returns a Future, bounding how many events are handled at once.
+
+    A leaderboard must be a LockedLeaderboard, a rate_limiter a
+    LockedRateLimiter.
+
+    batch_window, game_store_path and metrics are not supported.
+    """
+    def __init__(self, line_bot_api, max_workers=16, membership_stripes=16,
+                 profile_cache_size=1024, profile_ttl=3600, **kwargs):
+        Master.__init__(self, line_bot_api, profile_cache_size, profile_ttl, **kwargs)
+        if self.leaderboard is not None and not isinstance(self.leaderboard, LockedLeaderboard):
+            raise TypeError("ThreadedMaster needs a LockedLeaderboard, games feed it from many threads")
+        if self.rate_limiter is not None and not isinstance(self.rate_limiter, LockedRateLimiter):
+            raise TypeError("ThreadedMaster needs a LockedRateLimiter, events check it from many threads")
+        self.profiles = LockedProfileCache(line_bot_api, max_size=profile_cache_size, ttl=profile_ttl)
+        self.group_locks = {}              # group_id -> Lock, kept for as long as the Master
+        self.group_locks_lock = threading.Lock()
+        self.membership_locks = [threading.Lock() for stripe in range(membership_stripes)]
+        self.local = threading.local()     # outbox of the event handled by this thread
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hangman")
+
+    def lock_of_group(self, group_id):
+        lock = self.group_locks.get(group_id)
+        if lock is None:
+            with self.group_locks_lock:
+                lock = self.group_locks.setdefault(group_id, threading.Lock())
+        return lock
+
+    def lock_of_member(self, user_id):
+        return self.membership_locks[hash(user_id) % len(self.membership_locks)]
+
+    def group_of(self, user_id):
+        with self.lock_of_member(user_id):
+            return self.memberships.get(user_id)
+
+    def add_player_to_game(self, user_id, group_id):
+        with self.lock_of_member(user_id):
+            Master.add_player_to_game(self, user_id, group_id)
+
+    def remove_player_from_game(self, user_id, group_id=None):
+        with self.lock_of_member(user_id):
+            Master.remove_player_from_game(self, user_id, group_id)
+
+    def remove_game(self, group_id):
+        # Drops every member of the group, so take every stripe, in order.
+        for lock in self.membership_locks:
+            lock.acquire()
+        try:
+            Master.remove_game(self, group_id)
+        finally:
+            for lock in self.membership_locks:
+                lock.release()
+
+    def post_reply(self, token, chat_array):
+        outbox = getattr(self.local, "outbox", None)
+        if outbox is None:
+            Master.post_reply(self, token, chat_array)
+        else:
+            outbox.append(("reply_message", (token, chat_array)))
+
+    def post_push(self, to, chat_array):
+        outbox = getattr(self.local, "outbox", None)
+        if outbox is None:
+            Master.post_push(self, to, chat_array)
+        else:
+            outbox.append(("push_message", (to, chat_array)))
+
+    def leave_group(self, group_id):
+        self.remove_game(group_id)
+        outbox = getattr(self.local, "outbox", None)
+        if outbox is None:
+            self.bot.leave_group(group_id)
+        else:
+            outbox.append(("leave_group", (group_id,)))
+
+    def prefetch_profile(self, received_text, user_id, group_id):
+        """
+        Fetch the profile of user_id into the profile cache, if the
+        game is going to need display_name for received_text.
+        """
+        game = self.games.get(group_id)
+        if received_text in getattr(game, "profile_keywords", ()) and self.profiles.lookup(user_id) is None:
+            self.profiles.fetch(user_id)
+
+    def query_reply(self, token, channel, received_text, user_id, **kwargs):
+        if self.classify(channel, received_text) == "ignore":
+            return
+        if channel == "public":
+            group_id = kwargs.get("group_id")
+        else:
+            group_id = self.group_of(user_id)
+            if group_id is None:
+                # Plays nowhere, Master would drop it.
+                return
+        self.prefetch_profile(received_text, user_id, group_id)
+
+        self.local.outbox = []
+        try:
+            while True:
+                with self.lock_of_group(group_id):
+                    if channel == "public" or self.group_of(user_id) == group_id:
+                        Master.query_reply(self, token, channel, received_text, user_id, **kwargs)
+                        break
+                # The user moved to another group meanwhile. Follow.
+                group_id = self.group_of(user_id)
+                if group_id is None:
+                    break
+            outbox = self.local.outbox
+        finally:
+            self.local.outbox = None
+
+        for method, args in outbox:
+            getattr(self.bot, method)(*args)
+
+    def submit(self, token, channel, received_text, user_id, **kwargs):
+        """
+        Handle an event on the thread pool. Return its Future.
+        """
+        return self.pool.submit(self.query_reply, token, channel, received_text, user_id, **kwargs)
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
+
+if __name__ == "__main__":
+    # Stress test: many groups guessing at once from the pool, against a
+    # bot whose every call blocks. Checks that no score update is lost,
+    # and how much of the blocking is overlapped.
+    #
+    # python hangman_threads.py [GROUPS] [PLAYERS] [LATENCY] [WORKERS ...]
+    import random
+    import string
+    import sys
+    import time
+
+    from fake_line_bot import FakeBlockingLineBotApi
+
+    groups = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    players = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.002
+    worker_counts = [int(workers) for workers in sys.argv[4:]] or [1, 4, 16, 64]
+    generator = random.Random(0)
+    words = ["".join(generator.choice(string.ascii_uppercase) for i in range(generator.randint(8, 20)))
+             for group in range(groups)]
+
+    for workers in worker_counts:
+        bot = FakeBlockingLineBotApi(latency=latency)
+        master = ThreadedMaster(bot, max_workers=workers)
+        # Set up every group at once too, one step after the other.
+        setup = [
+            [("public", "/gameon", "host", "G%d" % group) for group in range(groups)],
+            [("public", "/join", "U%d-%d" % (group, player), "G%d" % group)
+             for group in range(groups) for player in range(players)],
+            [("private", "/add " + words[group], "U%d-0" % group, None) for group in range(groups)],
+            [("public", "/continue", "U%d-0" % group, "G%d" % group) for group in range(groups)],
+        ]
+        for step in setup:
+            for future in [master.submit("token", channel, text, user_id, group_id=group_id)
+                           for channel, text, user_id, group_id in step]:
+                future.result()
+
+        # Every player but the giver guesses every letter, all groups at once.
+        events = [("G%d" % group, "U%d-%d" % (group, player), letter)
+                  for group in range(groups) for player in range(1, players)
+                  for letter in string.ascii_uppercase]
+        generator.shuffle(events)
+        replies_before = bot.reply_calls
+        start = time.perf_counter()
+        futures = [master.submit("token", "public", letter, user_id, group_id=group_id)
+                   for group_id, user_id, letter in events]
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - start
+        master.shutdown()
+
+        lost = 0
+        for group in range(groups):
+            game = master.games["G%d" % group]
+            scored = sum(score for user_id, score in game.scoreboard.ranking())
+            lost += abs(len(set(words[group])) * game.score_per_letter - scored)
+        problems = master.memberships.verify()
+        if len(master.memberships) != groups * players:
+            problems.append("%d members, expected %d" % (len(master.memberships), groups * players))
+        blocking = (bot.reply_calls - replies_before) * latency
+        print("%3d workers: %d events in %.2fs, %.0f events/s, %d lost score updates, "
+              "%d membership problems, I/O overlap %.1fx" % (
+                  workers, len(events), elapsed, len(events) / elapsed, lost, len(problems), blocking / elapsed))
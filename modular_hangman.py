@@ -1,8 +1,395 @@
+import bisect
+import shelve
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from functools import partial
+from itertools import islice
+
+from linebot.models import TextSendMessage
+
+from hangman_metrics import COUNT_BUCKETS, SIZE_BUCKETS
+
+# Bit of each letter A to Z in letter bitmasks. Other letters get bits
+# from 26 on, per word, see Hangman.letter_bit.
+LETTER_BITS = {letter: 1 << code for code, letter in enumerate("ABCDEFGHIJKLMNOPQRSTUVWXYZ")}
+
+# Shown slot of each character, char + " ", shared by every game's show_buffer.
+SHOWN_SLOTS = {}
+
+# Folded form of each character seen, see fold_letter.
+FOLDED_LETTERS = {}
+
+# Deletes every ASCII character but letters and digits, see fold_phrase.
+ASCII_NON_ALNUM = {code: None for code in range(128) if not chr(code).isalnum()}
+
+def fold_letter(char):
+    """
+    Form char is matched in, uppercase and without accents, so that
+    e, é and É are one letter: NFKD, then combining marks dropped. A
+    char that doesn't fold to one character is only uppercased, or
+    kept as is if even that makes more than one, like ß.
+    """
+    folded = FOLDED_LETTERS.get(char)
+    if folded is None:
+        decomposed = unicodedata.normalize("NFKD", char)
+        folded = "".join(part for part in decomposed if not unicodedata.combining(part)).upper()
+        if len(folded) != 1:
+            folded = char.upper() if len(char.upper()) == 1 else char
+        FOLDED_LETTERS[char] = folded
+    return folded
+
+def fold_phrase(phrase):
+    """
+    Key a whole-phrase guess must match, the folded letters and digits
+    of phrase alone. Case, accents, punctuation and spacing don't count.
+    Uppercased first, as active_word is, so STRASSE matches Straße.
+    """
+    phrase = phrase.upper()
+    if phrase.isascii():
+        return phrase.translate(ASCII_NON_ALNUM)
+    return "".join([fold_letter(char) for char in phrase if char.isalnum()])
+
+def split_message(text, limit):
+    """
+    Split text into pieces of at most limit characters, at line
+    boundaries. A line longer than limit is cut where it must. Blank
+    lines at the ends of a piece are dropped, and so are pieces left
+    empty, as LINE rejects empty messages.
+    """
+    pieces = []
+    piece = None
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if piece is not None:
+                pieces.append(piece)
+                piece = None
+            pieces.append(line[:limit])
+            line = line[limit:]
+        if piece is None:
+            piece = line
+        elif len(piece) + 1 + len(line) <= limit:
+            piece += "\n" + line
+        else:
+            pieces.append(piece)
+            piece = line
+    if piece is not None:
+        pieces.append(piece)
+    return [piece for piece in (piece.strip("\n") for piece in pieces) if piece]
+
 class Messenger:
+    __slots__ = ("reply_array", "join_user", "unjoin_user")
+    
     def __init__(self, reply_array, **kwargs):
         self.reply_array = reply_array                  # Stores the reply array
-        self.join_user = kwargs.get("join_users")       # Stores user id joining
-        self.unjoin_user = kwargs.get("unjoin_users")   # Stores user id quitting
+        self.join_user = kwargs.get("join_user")        # Stores user id joining
+        self.unjoin_user = kwargs.get("unjoin_user")    # Stores user id quitting
+
+class Scoreboard:
+    """
+    Table of participant and score, kept in rank order as scores change.
+    
+    Scores are held in a dictionary from user_id to score. The rank order is
+    held in buckets: one sorted list of user_id for each distinct score, and
+    a sorted list of the distinct scores themselves. A score update moves one
+    user_id from one bucket to another, so rendering the scoreboard is a walk
+    over the buckets and never a full sort.
+    
+    Ties are ranked by user_id in descending order, as the former
+    sorted(zip(scores, user_ids), reverse=True) did.
+    """
+    __slots__ = ("scores", "buckets", "ranked_scores", "version")
+    
+    def __init__(self):
+        self.scores = {}                   # user_id -> score
+        self.buckets = {}                  # score -> sorted list of user_id with that score
+        self.ranked_scores = []            # Sorted list of distinct scores, lowest first
+        self.version = 0                   # Bumped on every change, for render caching
+    
+    def __contains__(self, user_id):
+        return user_id in self.scores
+    
+    def __len__(self):
+        return len(self.scores)
+    
+    def add_player(self, user_id, score=0):
+        """
+        Put user_id on the scoreboard. Does nothing if already on it.
+        """
+        if user_id not in self.scores:
+            self.scores[user_id] = score
+            self.insert_into_bucket(user_id, score)
+            self.version += 1
+    
+    def add_score(self, user_id, amount):
+        """
+        Add amount to the score of user_id, who must be on the scoreboard.
+        """
+        score = self.scores[user_id]
+        self.remove_from_bucket(user_id, score)
+        score += amount
+        self.scores[user_id] = score
+        self.insert_into_bucket(user_id, score)
+        self.version += 1
+    
+    def get_score(self, user_id):
+        return self.scores.get(user_id)
+    
+    def insert_into_bucket(self, user_id, score):
+        bucket = self.buckets.get(score)
+        if bucket is None:
+            bucket = self.buckets[score] = []
+            bisect.insort(self.ranked_scores, score)
+        bisect.insort(bucket, user_id)
+    
+    def remove_from_bucket(self, user_id, score):
+        bucket = self.buckets[score]
+        del bucket[bisect.bisect_left(bucket, user_id)]
+        if not bucket:
+            del self.buckets[score]
+            del self.ranked_scores[bisect.bisect_left(self.ranked_scores, score)]
+    
+    def ranking(self):
+        """
+        Yield (user_id, score) pairs from the highest score down.
+        """
+        for score in reversed(self.ranked_scores):
+            for user_id in reversed(self.buckets[score]):
+                yield user_id, score
+
+class Ranking:
+    """
+    Scores of any number of players in rank order, for Leaderboard.
+    
+    Held like Scoreboard, one bucket per distinct score and a sorted list
+    of the distinct scores, but a bucket is a dictionary in the order its
+    players reached that score instead of a sorted list. Moving a player
+    to another bucket is then O(1) however many players share a score,
+    plus a bisect over the distinct scores, and walking the top k players
+    is O(k). Ties go to whoever reached the score first.
+    """
+    __slots__ = ("scores", "buckets", "ranked_scores")
+    
+    def __init__(self):
+        self.scores = {}                   # user_id -> score
+        self.buckets = {}                  # score -> {user_id: None}, in the order they reached it
+        self.ranked_scores = []            # Sorted list of distinct scores, lowest first
+    
+    def __len__(self):
+        return len(self.scores)
+    
+    def add_score(self, user_id, amount):
+        """
+        Add amount to the score of user_id, putting them in the
+        ranking at amount if not in it yet.
+        """
+        score = self.scores.get(user_id)
+        if score is not None:
+            bucket = self.buckets[score]
+            del bucket[user_id]
+            if not bucket:
+                del self.buckets[score]
+                del self.ranked_scores[bisect.bisect_left(self.ranked_scores, score)]
+            score += amount
+        else:
+            score = amount
+        self.scores[user_id] = score
+        bucket = self.buckets.get(score)
+        if bucket is None:
+            bucket = self.buckets[score] = {}
+            bisect.insort(self.ranked_scores, score)
+        bucket[user_id] = None
+    
+    def get_score(self, user_id):
+        return self.scores.get(user_id)
+    
+    def ranking(self):
+        """
+        Yield (user_id, score) pairs from the highest score down.
+        """
+        for score in reversed(self.ranked_scores):
+            for user_id in self.buckets[score]:
+                yield user_id, score
+
+class Leaderboard:
+    """
+    Server-wide ranking of players across every game, fed by the games
+    as they score, see Hangman.add_score.
+    
+    All-time scores are kept in a Ranking, and so are the scores of the
+    current day and week, so every view is a walk down the top of one.
+    A window is started afresh on the first use after it ends. Days and
+    weeks are UTC, weeks start on Monday.
+    
+    One Leaderboard is shared by every game of a Master, which attaches
+    it, so games never pickle it. It covers the games of one process.
+    """
+    # Window name -> (length, offset) in seconds. The epoch was a Thursday.
+    windows = {"daily": (86400, 0), "weekly": (7 * 86400, 3 * 86400)}
+    
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.all_time = Ranking()
+        self.current = {}                  # Window name -> (window number, Ranking)
+        self.names = {}                    # user_id -> display_name last seen scoring
+    
+    def __len__(self):
+        return len(self.all_time)
+    
+    def window_number(self, window, now):
+        length, offset = self.windows[window]
+        return int((now + offset) // length)
+    
+    def ranking_of(self, window=None):
+        """
+        Return the Ranking of window, a name in windows, or the all-time
+        one if window is None.
+        """
+        if window is None:
+            return self.all_time
+        number = self.window_number(window, self.clock())
+        current = self.current.get(window)
+        if current is None or current[0] != number:
+            current = self.current[window] = (number, Ranking())
+        return current[1]
+    
+    def add_score(self, user_id, amount, display_name=None):
+        if display_name is not None:
+            self.names[user_id] = display_name
+        self.all_time.add_score(user_id, amount)
+        for window in self.windows:
+            self.ranking_of(window).add_score(user_id, amount)
+    
+    def top(self, k, window=None):
+        """
+        Return the k highest (user_id, score) pairs of window, see
+        ranking_of.
+        """
+        return list(islice(self.ranking_of(window).ranking(), k))
+    
+    def get_name(self, user_id, default=None):
+        return self.names.get(user_id, default)
+
+class WordQueue:
+    """
+    Waiting list of words, served round-robin across their givers.
+    
+    Each giver has a deque of their words, and givers take turns in the
+    order they first had a word waiting. A giver with many words waiting
+    no longer holds everyone else back. Adding and taking a word are both
+    O(1). max_per_giver, if set, caps the words a giver can have waiting.
+    """
+    __slots__ = ("max_per_giver", "words_of", "turns", "length")
+    
+    def __init__(self, max_per_giver=None):
+        self.max_per_giver = max_per_giver
+        self.words_of = {}                 # giver -> deque of their waiting words
+        self.turns = deque()               # Givers with words waiting, next to serve first
+        self.length = 0
+    
+    def __len__(self):
+        return self.length
+    
+    def __iter__(self):
+        """
+        Iterate over waiting words in the order they will be served.
+        """
+        turns = [iter(self.words_of[giver]) for giver in self.turns]
+        while turns:
+            still_waiting = []
+            for words in turns:
+                for word in words:
+                    yield word
+                    still_waiting.append(words)
+                    break
+            turns = still_waiting
+    
+    def count_of(self, giver):
+        words = self.words_of.get(giver)
+        return len(words) if words is not None else 0
+    
+    def is_full_for(self, giver):
+        return self.max_per_giver is not None and self.count_of(giver) >= self.max_per_giver
+    
+    def enqueue(self, word, giver):
+        words = self.words_of.get(giver)
+        if words is None:
+            words = self.words_of[giver] = deque()
+            self.turns.append(giver)
+        words.append(word)
+        self.length += 1
+    
+    def dequeue(self):
+        """
+        Take the next word. Return (word, giver).
+        """
+        giver = self.turns.popleft()
+        words = self.words_of[giver]
+        word = words.popleft()
+        if words:
+            self.turns.append(giver)
+        else:
+            del self.words_of[giver]
+        self.length -= 1
+        return word, giver
+
+class History:
+    """
+    History of who guesses what for how much score, and what word was in play.
+    
+    Only the last few entries are ever shown, so those are kept in a ring
+    buffer of fixed capacity, each entry being (user_id, guess, score,
+    show_string). Older entries fall off the ring buffer.
+    
+    The full history is optional. When kept, it goes into a compact archive
+    that stores, for each word played, the word and the letters each guess
+    revealed, instead of a copy of show_string per guess. The show_string
+    of any archived entry is rebuilt on demand.
+    """
+    __slots__ = ("recent", "archive", "version")
+    
+    def __init__(self, capacity=20, keep_archive=False):
+        self.recent = deque(maxlen=capacity)    # Last entries, oldest first
+        self.archive = [] if keep_archive else None
+        self.version = 0                   # Bumped on every record, for render caching
+        # Archive layout: list of [word, [(user_id, guess, score, revealed_letters), ...]]
+    
+    def __len__(self):
+        return len(self.recent)
+    
+    def start_word(self, word):
+        """
+        Open a new word in the archive. Called when a word is fetched.
+        """
+        if self.archive is not None:
+            self.archive.append([word, []])
+    
+    def record(self, user_id, guess, score, show_string, revealed_letters):
+        """
+        Record a correct guess. revealed_letters is the string of
+        letters the guess newly revealed.
+        """
+        self.recent.append((user_id, guess, score, show_string))
+        self.version += 1
+        if self.archive is not None and self.archive:
+            self.archive[-1][1].append((user_id, guess, score, revealed_letters))
+    
+    def archived_entries(self):
+        """
+        Yield every archived entry as (user_id, guess, score, show_string),
+        oldest first, rebuilding each show_string from the reveals.
+        """
+        if self.archive is None:
+            return
+        for word, entries in self.archive:
+            revealed = set()
+            for user_id, guess, score, revealed_letters in entries:
+                revealed.update(revealed_letters)
+                show_string = "".join([
+                    (char if (fold_letter(char) in revealed or not char.isalpha()) else "_") + " "
+                    for char in word
+                ])
+                yield user_id, guess, score, show_string
 
 class Hangman:
     """
@@ -26,6 +413,7 @@ class Hangman:
     # KEYWORDS USED IN-GAME
 
     keyword_start_game = "/start"
+    keyword_help = "/help"
     keyword_join = "/join"
     keyword_unjoin = "/quit"
     keyword_end = "/end"
@@ -34,29 +422,77 @@ class Hangman:
     keyword_continue_game = "/continue"
     keyword_show = "/show"
     keyword_add_word = "/add"
+    keyword_hint = "/hint"
+    keyword_leaderboard = "/leaderboard"
     
-    def __init__(self, score_per_letter, score_per_word):
+    reserved_keywords = frozenset((keyword_help, keyword_join, keyword_unjoin, keyword_scoreboard,
+                                   keyword_history, keyword_continue_game, keyword_show, keyword_hint,
+                                   keyword_leaderboard))
+                                           # Keywords that can't be given as words
+    profile_keywords = (keyword_join,)     # Keywords whose handling needs display_name
+    private_keywords = (keyword_add_word,) # Keywords handled in private chat. Master drops the rest.
+    listens_to_chatter = False             # Group chat that is neither a keyword nor a guess is ignored
+    leaderboard_size = 10                  # Players shown by /leaderboard
+    
+    # Tens of thousands of games can be resident, so no __dict__ per game.
+    __slots__ = ("score_per_letter", "score_per_word", "active_word", "waiting_list", "show_string",
+                 "letters_required", "letters_revealed", "letters_missed", "extra_letters",
+                 "active_key", "letter_positions", "show_buffer", "participants", "participants_version",
+                 "render_cache", "scoreboard", "history", "active_word_source", "known_words",
+                 "lexicon", "solver", "solver_session", "leaderboard", "paused")
+    
+    def __init__(self, score_per_letter=1, score_per_word=10, keep_history_archive=False,
+                 max_words_per_giver=None):
         self.score_per_letter = score_per_letter
         self.score_per_word = score_per_word    
         self.active_word = ""              # Active word in play
-        self.waiting_list = []             # Words in waiting list
+        self.waiting_list = WordQueue(max_words_per_giver)
+                                           # Words in waiting list, with their givers. Served round-robin by giver.
         self.show_string = ""              # Shown string. H_NGM_N
-        self.letter_states = {}            # States of each letter. Is it guessed?
+        self.letters_required = 0          # Bitmask of the letters in active_word, see letter_bit
+        self.letters_revealed = 0          # Bitmask of the letters guessed. Word is guessed when equal.
+        self.letters_missed = 0            # Bitmask of the letters A to Z guessed that are not in active_word
+        self.extra_letters = ""            # Folded letters of active_word other than A to Z, bits 26 on
+        self.active_key = ""               # fold_phrase of active_word, what a word guess must match
+        self.letter_positions = {}         # Positions of each folded letter in active_word, built once per word.
+        self.show_buffer = []              # Rendered slot per character of active_word, patched on reveal.
         self.participants = {}             # Participant dictionary. Storing user_id and display_name at join.
                                            # NOTE TO SELF: WHAT IF SOMEONE /ADD THEN /QUIT?
                                            # "Player is not in game anymore."
-        self.scoreboard = [[],[]]          # Table of participant and score. List of lists to preserve ordering.
-        self.history = [[],[],[],[]]       # History of who guesses what for how much score, and what word was in play.
+        self.participants_version = 0      # Bumped on every join and quit, for render caching
+        self.render_cache = {}             # Renderer name -> (versions rendered at, text)
+        self.scoreboard = Scoreboard()     # Table of participant and score, kept in rank order.
+        self.history = History(keep_archive=keep_history_archive)
+                                           # History of who guesses what for how much score. Last 20 only,
+                                           # unless the full archive is kept.
         
-        """
-        Sources, or givers, are not implemented in list of list style
-        to minimize interruptions and edits that go with its introduction/implementation
-        """
-        self.waiting_source = []           # The giver of each word in the waiting list
         self.active_word_source = ""       # The giver of the currently active word
+        self.known_words = set()           # Normalized form of every word accepted in this game
+        self.lexicon = None                # hangman_lexicon.Lexicon words must be in, or None to allow any
+        self.solver = None                 # hangman_solver.Solver for /hint, or None for no hints
+        self.solver_session = None         # Candidates narrowed so far for active_word, see SolverSession
+        self.leaderboard = None            # Leaderboard shared by every game of the Master, or None
         
         self.paused = True                 # Pause system. Introduced to combat /continue bug
     
+    def __getstate__(self):
+        # Slotted, so there is no __dict__ to pickle. Subclasses without
+        # __slots__ still have one.
+        state = dict(getattr(self, "__dict__", {}))
+        for cls in type(self).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                if hasattr(self, name):
+                    state[name] = getattr(self, name)
+        # Shared by every game, attached again by the Master.
+        state["leaderboard"] = None
+        state["lexicon"] = None
+        state["solver"] = None
+        return state
+    
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+    
     def include_participant(self, user_id, display_name):
         """
         Include participant with user_id and using display_name
@@ -68,9 +504,8 @@ class Hangman:
         join_user = None
         if user_id not in self.participants:
             self.participants[user_id] = display_name
-            if user_id not in self.scoreboard:
-                self.scoreboard[0] += [user_id]
-                self.scoreboard[1] += [0]
+            self.participants_version += 1
+            self.scoreboard.add_player(user_id)
             reply_array.append(
                 (display_name + " has joined. " +
                  "You can submit words privately by using " +
@@ -95,6 +530,7 @@ class Hangman:
                 self.participants.get(user_id) + " is removed from play."
             )
             del self.participants[user_id]
+            self.participants_version += 1
             unjoin_user = user_id
         else:
             reply_array.append(
@@ -116,25 +552,99 @@ class Hangman:
         return Messenger(reply_array)
     
     def initiate_letter_states(self):  # For setting the letter states into all-false (no guessed letters) after a new word is given
-        unique_letters = self.active_word.upper()
-        unique_letters = list(set(list(unique_letters)))
-        unique_letters = list(''.join(filter(str.isalpha, ''.join(unique_letters))))
-        self.letter_states = {k: False for k in unique_letters}
+        # Also index every letter, folded, to the positions it occupies, so
+        # that a reveal only touches its own slots in show_buffer, and key
+        # the word for word guesses. Guesses are folded the same way.
+        self.letters_required = 0
+        self.letters_revealed = 0
+        self.letters_missed = 0
+        self.extra_letters = ""
+        self.letter_positions = {}
+        key = []
+        for position, char in enumerate(self.active_word):
+            if char.isalnum():
+                letter = fold_letter(char)
+                key.append(letter)
+                if not char.isalpha():
+                    continue
+                if letter not in LETTER_BITS and letter not in self.extra_letters:
+                    self.extra_letters += letter
+                self.letters_required |= self.letter_bit(letter)
+                self.letter_positions.setdefault(letter, []).append(position)
+        self.active_key = "".join(key)
+        for letter, positions in self.letter_positions.items():
+            self.letter_positions[letter] = tuple(positions)
+    
+    def letter_bit(self, letter):
+        """
+        Return the bit of letter, folded, in the letter bitmasks, 0 if
+        it can't be in active_word.
+        """
+        bit = LETTER_BITS.get(letter)
+        if bit is None:
+            index = self.extra_letters.find(letter) if len(letter) == 1 else -1
+            bit = 1 << (26 + index) if index >= 0 else 0
+        return bit
+    
+    def letters_remaining(self):
+        """
+        Return how many letters of active_word are not guessed yet.
+        """
+        return bin(self.letters_required & ~self.letters_revealed).count("1")
+    
+    def get_letter_states(self):
+        """
+        Return {letter: is it guessed?} for every folded letter of active_word.
+        """
+        return {letter: bool(self.letter_bit(letter) & self.letters_revealed)
+                for letter in self.letter_positions}
+    
+    def get_missed_letters(self):
+        """
+        Return the letters A to Z guessed that are not in active_word.
+        """
+        return [letter for letter, bit in LETTER_BITS.items() if bit & self.letters_missed]
     
     def update_show_string(self):
         """
-        Update the show_string. Not return anything.
+        Rebuild the whole show_buffer from the letter bitmasks, then
+        render the show_string. Not return anything.
         """
-        self.show_string = ""
-        char_index = 0
+        self.show_buffer = []
         for char in self.active_word:
-            if self.letter_states.get(char, True):
-                # This way, punctuation and other nonalphabet character is 
-                # always shown.
-                self.show_string += char
-            else:
-                self.show_string += "_"
-            self.show_string += " "          # Add space after each characters. Will improve readability.
+            # This way, punctuation and other nonalphabet character is 
+            # always shown. Letters not guessed are hidden below.
+            slot = SHOWN_SLOTS.get(char)
+            if slot is None:
+                slot = SHOWN_SLOTS[char] = char + " "
+            self.show_buffer.append(slot)
+        for letter, positions in self.letter_positions.items():
+            if not self.letter_bit(letter) & self.letters_revealed:
+                for position in positions:
+                    self.show_buffer[position] = "_ "    # Add space after each characters. Will improve readability.
+        self.render_show_string()
+    
+    def reveal_letter(self, letter):
+        """
+        Mark letter, folded, guessed and patch only the slots of
+        show_buffer where it appears, each showing the letter as given,
+        accents and all. Does not render show_string, call
+        render_show_string after.
+        """
+        self.letters_revealed |= self.letter_bit(letter)
+        active_word = self.active_word
+        for position in self.letter_positions.get(letter, ()):
+            char = active_word[position]
+            slot = SHOWN_SLOTS.get(char)
+            if slot is None:
+                slot = SHOWN_SLOTS[char] = char + " "
+            self.show_buffer[position] = slot
+    
+    def render_show_string(self):
+        """
+        Render show_string from show_buffer in one join.
+        """
+        self.show_string = "".join(self.show_buffer)
     
     def show_banner(self):
         """
@@ -143,16 +653,43 @@ class Hangman:
         return Messenger([self.show_string])
     
     def word_is_guessed(self):
-        if all(self.letter_states.values()):
-            return True
-        else:
-            return False
+        return self.letters_revealed == self.letters_required
+    
+    def normalize_word(self, word):
+        """
+        Normalized form of word for spotting duplicates: uppercase,
+        with runs of whitespace made one space.
+        """
+        return " ".join(word.upper().split())
+    
+    def rejection_of(self, word):
+        """
+        Return why word can't be played in this game, and the words of
+        it not in the lexicon. Why is "keyword", "short", "duplicate",
+        "unknown", when a word of it is not in the lexicon, or None if
+        it can be played. The lexicon is looked up once.
+        """
+        if "/" + word in self.reserved_keywords:
+            # word is a keyword.
+            return "keyword", None
+        elif len(word) < 5:
+            # Word too short. Minimum 5 letters.
+            return "short", None
+        elif self.normalize_word(word) in self.known_words:
+            return "duplicate", None
+        elif self.lexicon is not None:
+            unknown_words = self.lexicon.unknown_words(word)
+            if unknown_words:
+                return "unknown", unknown_words
+        return None, None
     
     def add_word(self, word, user_id):
         """
-        Append the word and the user_id to the respective waiting lists.
+        Put the word in the waiting list, given by user_id.
         
-        Will reply with rejection message if word added is a keyword.
+        Will reply with rejection message if word added is a keyword,
+        was already given in this game, has a word not in the lexicon,
+        or if user_id already has as many words waiting as allowed.
         """
         reply_array = []
         if not self.paused:
@@ -160,39 +697,82 @@ class Hangman:
                 ("Cannot submit word, " +
                  "game is not in paused state.")
             )
-        elif ("/" + word in [self.keyword_help,
-                             self.keyword_join,
-                             self.keyword_unjoin,
-                             self.keyword_scoreboard,
-                             self.keyword_history,
-                             self.keyword_continue_game,
-                             self.keyword_show]):
-            # word is a keyword.
+            return Messenger(reply_array)
+        
+        rejection, unknown_words = self.rejection_of(word)
+        if rejection == "keyword":
             reply_array.append(
                 ("Your proposed word is rejected " + 
                  "because it's a reserved keyword.")
             )
-        elif len(word) < 5:
-            # Word too short. Minimum 5 letters.
+        elif rejection == "short":
             reply_array.append(
                 ("Your proposed word is rejected because it's too short.")
             )
+        elif rejection == "duplicate":
+            reply_array.append(
+                ("Your proposed word is rejected because it's already been given.")
+            )
+        elif rejection == "unknown":
+            reply_array.append(
+                ("Your proposed word is rejected because it's not in the dictionary: " +
+                 ", ".join(unknown_words) + ".")
+            )
+        elif self.waiting_list.is_full_for(user_id):
+            reply_array.append(
+                ("Your proposed word is rejected because you already have " +
+                 "too many words waiting.")
+            )
         
         else:
-            self.waiting_list.append(word)
-            self.waiting_source.append(user_id)
+            self.waiting_list.enqueue(word, user_id)
+            self.known_words.add(self.normalize_word(word))
             reply_array.append("Your proposed word is accepted.")
         
         return Messenger(reply_array)
     
+    def import_words(self, lines, user_id):
+        """
+        Put every word in lines, one per line, in the waiting list as
+        given by user_id. lines can be an open word-pack file, which is
+        read as it goes. Blank lines are skipped.
+        
+        Words are checked as in add_word, except that the game needn't
+        be paused and the per-giver cap does not apply. Return a single
+        summary instead of a reply per word.
+        """
+        accepted = 0
+        rejected = {"keyword": 0, "short": 0, "duplicate": 0, "unknown": 0}
+        for line in lines:
+            word = line.strip()
+            if not word:
+                continue
+            rejection = self.rejection_of(word)[0]
+            if rejection is None:
+                self.waiting_list.enqueue(word, user_id)
+                self.known_words.add(self.normalize_word(word))
+                accepted += 1
+            else:
+                rejected[rejection] += 1
+        
+        summary = ("Imported " + str(accepted) + " words. Rejected " +
+                   str(rejected["keyword"]) + " reserved keywords, " +
+                   str(rejected["short"]) + " too short")
+        if self.lexicon is not None:
+            summary += ", " + str(rejected["unknown"]) + " not in the dictionary"
+        summary += " and " + str(rejected["duplicate"]) + " duplicates."
+        return Messenger([summary])
+    
     def fetch_word(self):
         """
         Take a word from waiting list.
         """
-        self.active_word = self.waiting_list.pop(0).upper()
-        self.active_word_source = self.waiting_source.pop(0)
+        word, self.active_word_source = self.waiting_list.dequeue()
+        self.active_word = word.upper()
+        self.solver_session = None
         self.initiate_letter_states()
         self.update_show_string()
+        self.history.start_word(self.active_word)
         
     
     def guess(self, user_id, letter):
@@ -201,7 +781,7 @@ class Hangman:
         the word using such letter. Return reply array.
         """
         reply_array = []
-        letter = letter.upper()
+        letter = fold_letter(letter)
         if self.paused:
             reply_array.append(
                 ("Game is now still paused." +
@@ -214,45 +794,29 @@ class Hangman:
                  " are the giver of this word." +
                  " You can't guess it.")
             )
+        elif user_id not in self.scoreboard:
+            # Checked before anything is revealed, there is no one to score.
+            reply_array.append(self.get_join_first())
         elif self.word_is_guessed():
             reply_array.append("Word is already guessed.")
-        elif letter in self.letter_states:
-            if not self.letter_states[letter]:
-                self.letter_states[letter] = True
-                
-                self.update_show_string()
+        elif self.letter_bit(letter) & self.letters_required:
+            if not self.letter_bit(letter) & self.letters_revealed:
+                self.reveal_letter(letter)
+                self.render_show_string()
                 
-                position = self.scoreboard[0].index(user_id)
-                self.scoreboard[1][position] += self.score_per_letter
+                self.add_score(user_id, self.score_per_letter)
             
-                self.history[0] += [user_id]
-                self.history[1] += [letter]
-                self.history[2] += [self.score_per_letter]
-                self.history[3] += [self.show_string]                
+                self.history.record(user_id, letter, self.score_per_letter, self.show_string, letter)
             else:
                 reply_array.append("Correct, but this letter is already guessed.")
         else:
+            self.letters_missed |= LETTER_BITS.get(letter, 0)
             reply_array.append("No such letter (" + letter + ").")
         
         reply_array.append(self.show_string)
         
         if self.word_is_guessed():
-            reply_array.append(self.get_scoreboard())
-            if self.waiting_list:
-                self.fetch_word()
-                reply_array.append(
-                    ("Guess this new word:\n" + self.show_string +
-                     "\n\nSubmitted by: " + self.participants.get(self.active_word_source, "Player not in game anymore."))
-                )
-            else:
-                self.paused = True
-                reply_array.append(
-                    ("Game is now paused." +
-                     " There is no word left in the waiting list." +
-                     " Please give word by using " + self.keyword_add_word +
-                     " to the OA. Then use " + self.keyword_continue_game +
-                     " here to continue the game.")
-                )
+            self.finish_word(reply_array)
         
         return Messenger(reply_array)
     
@@ -274,54 +838,172 @@ class Hangman:
                  " are the giver of this word." +
                  " You can't guess it.")
             )
+        elif user_id not in self.scoreboard:
+            # Checked before anything is revealed, there is no one to score.
+            reply_array.append(self.get_join_first())
         elif self.word_is_guessed():
-            reply_array.append(TextSendMessage(text="Word is already guessed."))
-        elif word.upper() == self.active_word.upper():
+            reply_array.append("Word is already guessed.")
+        elif fold_phrase(word) == self.active_key:
             """
-            Caution: This if function requires the guess to be exact down to the punctuation.
-            The guess can only vary in lower vs uppercase. Not including the punctuation makes the guess wrong.
-            However, in single-letter guesses, punctuation is not necessary to be guessed to make the word complete.
+            The guess must have every letter and digit, in order. Case, accents,
+            punctuation and spacing may differ, as in single-letter guesses.
             """
-            user_position = self.scoreboard[0].index(user_id)
-            self.scoreboard[1][user_position] += self.score_per_word
-            letters_remaining = 0
-            for letter in self.letter_states:
-                if not self.letter_states[letter]:
-                    self.letter_states[letter] = True
-                    self.scoreboard[1][user_position] += self.score_per_letter
-                    letters_remaining += 1
+            revealed_letters = ""
+            for letter in self.letter_positions:
+                if not self.letter_bit(letter) & self.letters_revealed:
+                    self.reveal_letter(letter)
+                    revealed_letters += letter
+            letters_remaining = len(revealed_letters)
+            self.add_score(user_id, self.score_per_word + letters_remaining*self.score_per_letter)
             
-            self.update_show_string()
+            self.render_show_string()
             
-            self.history[0] += [user_id]
-            self.history[1] += [word]
-            self.history[2] += [self.score_per_word + letters_remaining*self.score_per_letter]
-            self.history[3] += [self.show_string]
+            self.history.record(user_id, word, self.score_per_word + letters_remaining*self.score_per_letter,
+                                self.show_string, revealed_letters)
         else:
             reply_array.append(word + " is not the right word.")
         
         reply_array.append(self.show_string)
         
         if self.word_is_guessed():
-            reply_array.append(self.get_scoreboard())
-            if self.waiting_list:
-                self.fetch_word()
-                reply_array.append(
-                    ("Guess this new word:\n" + self.show_string +
-                     "\n\nSubmitted by: " + self.participants.get(self.active_word_source, "Player not in game anymore."))
-                )
+            self.finish_word(reply_array)
+        
+        return Messenger(reply_array)
+    
+    def add_score(self, user_id, amount):
+        """
+        Add amount to the score of user_id on the scoreboard, and on
+        the leaderboard if the game has one.
+        """
+        self.scoreboard.add_score(user_id, amount)
+        if self.leaderboard is not None:
+            self.leaderboard.add_score(user_id, amount, self.participants.get(user_id))
+    
+    def finish_word(self, reply_array):
+        """
+        Wrap up a guessed word: append the scoreboard, then either
+        fetch the next word or pause. Append to reply_array.
+        """
+        reply_array.append(self.get_scoreboard())
+        if self.waiting_list:
+            self.fetch_word()
+            reply_array.append(
+                ("Guess this new word:\n" + self.show_string +
+                 "\n\nSubmitted by: " + self.participants.get(self.active_word_source, "Player not in game anymore."))
+            )
+        else:
+            self.paused = True
+            reply_array.append(
+                ("Game is now paused." +
+                 " There is no word left in the waiting list." +
+                 " Please give word by using " + self.keyword_add_word +
+                 " to the OA. Then use " + self.keyword_continue_game +
+                 " here to continue the game.")
+            )
+    
+    def guess_batch(self, guesses):
+        """
+        Take an ordered list of (user_id, guess) and apply them all,
+        as guess does for a single letter and guess_word for anything
+        longer. The first correct guesser of each letter scores.
+        
+        The banner is rendered once per word instead of once per guess,
+        and every guess goes into one summary, in the order guessed.
+        History entries of one word in a batch share the banner shown at
+        its end. A guess from a player who hasn't joined changes nothing.
+        
+        Return a single Messenger, packed into one reply by
+        Master.pack_messages.
+        """
+        reply_array = []
+        batch = {"entries": [], "lines": [], "missed": [], "repeated": [], "open": False}
+        remaining = self.letters_remaining()
+        for user_id, guess in guesses:
+            batch["open"] = True
+            if self.paused:
+                line = ("Game is now still paused." +
+                        " Use " + self.keyword_continue_game +
+                        " to continue the game.")
+            elif user_id == self.active_word_source:
+                line = ("You, " + self.participants.get(user_id) +
+                        " are the giver of this word." +
+                        " You can't guess it.")
+            elif user_id not in self.scoreboard:
+                line = self.get_join_first()
+            elif remaining == 0:
+                line = "Word is already guessed."
+            elif len(guess) == 1:
+                line = None
+                letter = fold_letter(guess)
+                if not self.letter_bit(letter) & self.letters_required:
+                    self.letters_missed |= LETTER_BITS.get(letter, 0)
+                    if not batch["missed"]:
+                        # All misses go in one line, where the first was.
+                        batch["entries"].append(("missed", None))
+                    if letter not in batch["missed"]:
+                        batch["missed"].append(letter)
+                elif self.letter_bit(letter) & self.letters_revealed:
+                    if not batch["repeated"]:
+                        batch["entries"].append(("repeated", None))
+                    if letter not in batch["repeated"]:
+                        batch["repeated"].append(letter)
+                else:
+                    self.reveal_letter(letter)
+                    remaining -= 1
+                    self.add_score(user_id, self.score_per_letter)
+                    batch["entries"].append(("scored", (user_id, letter, self.score_per_letter, letter)))
+            elif fold_phrase(guess) == self.active_key:
+                line = None
+                revealed_letters = ""
+                for letter in self.letter_positions:
+                    if not self.letter_bit(letter) & self.letters_revealed:
+                        self.reveal_letter(letter)
+                        revealed_letters += letter
+                remaining = 0
+                score = self.score_per_word + len(revealed_letters)*self.score_per_letter
+                self.add_score(user_id, score)
+                batch["entries"].append(("scored", (user_id, guess, score, revealed_letters)))
             else:
-                self.paused = True
-                reply_array.append(
-                    ("Game is now paused." +
-                     " There is no word left in the waiting list." +
-                     " Please give word by using " + self.keyword_add_word +
-                     " to the OA. Then use " + self.keyword_continue_game +
-                     " here to continue the game.")
-                )
+                line = guess + " is not the right word."
+            
+            if line is not None and line not in batch["lines"]:
+                batch["lines"].append(line)
+                batch["entries"].append(("line", line))
+            if remaining == 0 and not self.paused:
+                # Word is done. Report it, then go on with the next one, if any.
+                self.report_batch(reply_array, batch)
+                remaining = self.letters_remaining()
         
+        if batch["open"]:
+            self.report_batch(reply_array, batch)
         return Messenger(reply_array)
     
+    def report_batch(self, reply_array, batch):
+        """
+        Render the banner once for the guesses gathered in batch, record
+        their history and append their summary to reply_array. Wrap up
+        the word if guessed. Empties batch for the next word.
+        """
+        self.render_show_string()
+        summary = []
+        for kind, entry in batch["entries"]:
+            if kind == "scored":
+                user_id, guess, score, revealed_letters = entry
+                self.history.record(user_id, guess, score, self.show_string, revealed_letters)
+                summary.append(str(self.get_name(user_id)) + " guessed " + guess + " (+" + str(score) + ").")
+            elif kind == "repeated":
+                summary.append("Correct, but already guessed (" + ", ".join(batch["repeated"]) + ").")
+            elif kind == "missed":
+                summary.append("No such letter (" + ", ".join(batch["missed"]) + ").")
+            else:
+                summary.append(entry)
+        if summary:
+            reply_array.append("\n".join(summary))
+        reply_array.append(self.show_string)
+        if self.word_is_guessed():
+            self.finish_word(reply_array)
+        batch.update(entries=[], lines=[], missed=[], repeated=[], open=False)
+    
     def continue_game(self):
         """
         Continue game after being paused, i.e. when no words
@@ -348,25 +1030,70 @@ class Hangman:
         
         return Messenger(reply_array)
     
-    def sort_scoreboard(self):
+    def give_hint(self):
+        """
+        Return a reply array of one member, the letter the solver
+        thinks best to guess next. Uses only what players can see.
+        """
+        if self.solver is None:
+            return Messenger(["Hints are not available in this game."])
+        if self.paused:
+            return Messenger(
+                ["Game is now still paused." +
+                 " Use " + self.keyword_continue_game +
+                 " to continue the game."]
+            )
+        if self.word_is_guessed():
+            return Messenger(["Word is already guessed."])
+        
+        if self.solver_session is None:
+            self.solver_session = self.solver.session()
+        # Letters as the solver knows them, CAFÉ as CAFE.
+        folded_word = "".join([fold_letter(char) for char in self.active_word])
+        letter = self.solver.best_letter(folded_word, self.get_letter_states(),
+                                         self.get_missed_letters(), self.solver_session)
+        if letter is None:
+            return Messenger(["No hint, this word is not in the dictionary."])
+        return Messenger(["Hint: try the letter " + letter + "."])
+    
+    def get_join_first(self):
         """
-        Sort the scoreboard.
+        Return the line telling a player who hasn't joined to join
+        before guessing.
         """
-        participants_sorted = [name for value, name in sorted(zip(self.scoreboard[1], self.scoreboard[0]), reverse=True)]
-        score_sorted = sorted(self.scoreboard[1], reverse=True)
-        self.scoreboard = [participants_sorted, score_sorted]
+        return "Join the game by saying " + self.keyword_join + " before guessing."
+    
+    def get_name(self, user_id, default=None):
+        """
+        Return the display_name of user_id in this game, or default
+        if user_id is not in play.
+        """
+        return self.participants.get(user_id, default)
+    
+    def get_cached_render(self, name, versions):
+        """
+        Return the text cached for renderer name if it was rendered
+        at the same versions, else None.
+        """
+        cached = self.render_cache.get(name)
+        if cached is not None and cached[0] == versions:
+            return cached[1]
+        return None
     
     def get_scoreboard(self):
         """
-        Return the scoreboard as a long string.
+        Return the scoreboard as a long string. The scoreboard
+        is already kept in rank order, no sorting needed. The text
+        is cached until a score or participant changes.
         """
-        self.sort_scoreboard()
-        scoreboard_chat = "SCOREBOARD"
-        for i in range(len(self.scoreboard[0])):
-            scoreboard_chat += "\n"
-            scoreboard_chat += str(self.get_name(self.scoreboard[0][i]))
-            scoreboard_chat += ": "
-            scoreboard_chat += str(self.scoreboard[1][i])
+        versions = (self.scoreboard.version, self.participants_version)
+        scoreboard_chat = self.get_cached_render("scoreboard", versions)
+        if scoreboard_chat is None:
+            lines = ["SCOREBOARD"]
+            for user_id, score in self.scoreboard.ranking():
+                lines.append(str(self.get_name(user_id)) + ": " + str(score))
+            scoreboard_chat = "\n".join(lines)
+            self.render_cache["scoreboard"] = (versions, scoreboard_chat)
         return scoreboard_chat
     
     def show_scoreboard(self):
@@ -377,23 +1104,40 @@ class Hangman:
         """
         return Messenger([self.get_scoreboard()])
     
+    def show_leaderboard(self, window=None):
+        """
+        Return a reply array of one member, the top players across
+        every game, of all time or of window, "daily" or "weekly".
+        """
+        if self.leaderboard is None:
+            return Messenger(["The leaderboard is not available."])
+        if window is not None and window not in self.leaderboard.windows:
+            return Messenger(["Say " + self.keyword_leaderboard + ", " + self.keyword_leaderboard +
+                              " daily or " + self.keyword_leaderboard + " weekly."])
+        
+        titles = {None: "LEADERBOARD", "daily": "LEADERBOARD OF THE DAY", "weekly": "LEADERBOARD OF THE WEEK"}
+        lines = [titles[window]]
+        for rank, (user_id, score) in enumerate(self.leaderboard.top(self.leaderboard_size, window), 1):
+            lines.append(str(rank) + ". " + str(self.leaderboard.get_name(user_id, "Unknown player")) +
+                         ": " + str(score))
+        if len(lines) == 1:
+            lines.append("No scores yet.")
+        return Messenger(["\n".join(lines)])
+    
     def show_history(self):
         """
         Return a reply array of one member, i.e.
         history. Implemented this way for consistency
         """
-        history_chat = "HISTORY"
-        length = len(self.history[0])
-        # Is 20 last entries enough?
-        for i in range(max(0, length-20), length):
-            history_chat += "\n"
-            history_chat += str(self.get_name(self.history[0][i]))
-            history_chat += " | "
-            history_chat += str(self.history[1][i])
-            history_chat += " | "
-            history_chat += str(self.history[2][i])
-            history_chat += " | "
-            history_chat += str(self.history[3][i])
+        versions = (self.history.version, self.participants_version)
+        history_chat = self.get_cached_render("history", versions)
+        if history_chat is None:
+            lines = ["HISTORY"]
+            # Is 20 last entries enough? See History capacity.
+            for user_id, guess, score, show_string in self.history.recent:
+                lines.append(" | ".join((str(self.get_name(user_id)), str(guess), str(score), str(show_string))))
+            history_chat = "\n".join(lines)
+            self.render_cache["history"] = (versions, history_chat)
         
         return Messenger([history_chat])
     
@@ -417,14 +1161,16 @@ class Hangman:
         reply_array.append((
             "4. KEYWORDS?" "\n"
             "Below are keywords usable in communicating with the bot in playing this game:" "\n"
-            "- '" + keyword_help + "' : display this help." "\n"
-            "- '" + keyword_join + "' : join a game in a group." "\n"
-            "- '" + keyword_unjoin + "' : quit a game in a group." "\n"
-            "- '" + keyword_add_word + "' : add a word or phrase to be guessed. Send to OA with format '" + keyword_add_word + " YOUR PHRASE HERE'. Multi-word phrase is allowded."  "\n"
-            "- '" + keyword_continue_game + "' : continue a paused game, after players have added words for the game." "\n"
-            "- '" + keyword_scoreboard + "' : display the scoreboard in a game." "\n"
-            "- '" + keyword_history + "' : display the history in a game up to last 20 correct guesses." "\n"
-            "- '" + keyword_show + "' : show the phrase in the game, just in case it gets too buried and you need to show it again." "\n"
+            "- '" + self.keyword_help + "' : display this help." "\n"
+            "- '" + self.keyword_join + "' : join a game in a group." "\n"
+            "- '" + self.keyword_unjoin + "' : quit a game in a group." "\n"
+            "- '" + self.keyword_add_word + "' : add a word or phrase to be guessed. Send to OA with format '" + self.keyword_add_word + " YOUR PHRASE HERE'. Multi-word phrase is allowded."  "\n"
+            "- '" + self.keyword_continue_game + "' : continue a paused game, after players have added words for the game." "\n"
+            "- '" + self.keyword_scoreboard + "' : display the scoreboard in a game." "\n"
+            "- '" + self.keyword_history + "' : display the history in a game up to last 20 correct guesses." "\n"
+            "- '" + self.keyword_show + "' : show the phrase in the game, just in case it gets too buried and you need to show it again." "\n"
+            "- '" + self.keyword_hint + "' : suggest a letter to guess next, when the game has a dictionary." "\n"
+            "- '" + self.keyword_leaderboard + "' : display the top players of every group. Add 'daily' or 'weekly' for today's or this week's." "\n"
             "\n"
         ))
         reply_array.append((
@@ -432,8 +1178,8 @@ class Hangman:
             "1 score for each correct letter guessed. When guessing entire phrase at once, the score given is how many letters un-guessed are remaining, plus extra 10 score." "\n"
             "\n"
             "6. MISCELLANEOUS" "\n"
-            "- You can customize the scoring when starting the game. Instead of saying '" + keyword_add_game + "', say '" + keyword_add_game + " 2 50' to change the scoring for 2 per letter and 50 extra per phrase. This can only be done when starting the game. The scoring can't be changed mid-game." "\n"
-            "- Guessing the entire phrase at once requires you to be precise." "\n"
+            "- You can customize the scoring when starting the game. Instead of saying '/gameon', say '/gameon 2 50' to change the scoring for 2 per letter and 50 extra per phrase. This can only be done when starting the game. The scoring can't be changed mid-game." "\n"
+            "- Guessing the entire phrase at once requires every letter, in order. Case, accents, punctuation and spacing don't matter, and neither do accents when guessing a letter." "\n"
             "- Your name will remain in the scoreboard once you join the game, even when you quit the game."
         ))
         return Messenger(reply_array)
@@ -460,7 +1206,7 @@ class Hangman:
         reply_array = []
         end_chat = ("Thank you for playing this game!" + 
                      " Now the game will be terminated.")
-        reply_array.append(self.get_scoreboard)
+        reply_array.append(self.get_scoreboard())
         reply_array.append(end_chat)
         return Messenger(reply_array)
     
@@ -475,12 +1221,14 @@ class Hangman:
         # The notion of Hangman class passing resulted actions may be useful.
         # NOTE TO SELF III: Use dictionary to pass result?
         # Better yet, create class responses?
+        # display_name is a callable returning the display name. Call it
+        # only when the name is needed, as it may cost a profile lookup.
         if channel == "public":
             group_id = group_id
             # A group chat.
             if received_text[0] == "/":
                 if received_text == self.keyword_join:
-                    return self.include_participant(user_id, display_name)
+                    return self.include_participant(user_id, display_name())
                 elif received_text == self.keyword_unjoin:
                     return self.exclude_participant(user_id)
                 if received_text == self.keyword_continue_game:
@@ -493,6 +1241,11 @@ class Hangman:
                     return self.show_banner()
                 elif received_text == self.keyword_help:
                     return self.show_help()
+                elif received_text == self.keyword_hint:
+                    return self.give_hint()
+                elif received_text.split(" ", 1)[0] == self.keyword_leaderboard:
+                    window = received_text.split(" ", 1)[1:]
+                    return self.show_leaderboard(window[0].strip().lower() if window else None)
                 else:
                     return self.guess_word(user_id, received_text[1:])
             else:
@@ -503,10 +1256,277 @@ class Hangman:
                     pass
         
         elif channel == "private":
-            if received_text.split()[0] == keyword_add_word:
-                return self.add_word(received_text.split(" ", 2)[1])
+            words = received_text.split(None, 1)
+            if words and words[0] == self.keyword_add_word:
+                # Everything after the keyword, multi-word phrase included.
+                # Nothing after it is rejected as too short.
+                return self.add_word(words[1] if len(words) > 1 else "", user_id)
         
 
+class ProfileCache:
+    """
+    Cache of display_name per user_id, sitting in front of get_profile.
+    
+    Entries expire after ttl seconds and are then fetched again. When the
+    cache is full, the least recently used entry is evicted. A failed
+    get_profile (e.g. the user has not added the OA as friend) is cached
+    too, for negative_ttl seconds, and answered with default_display_name.
+    
+    hits and misses count lookups answered from and past the cache.
+    """
+    def __init__(self, line_bot_api, max_size=1024, ttl=3600, negative_ttl=60,
+                 default_display_name="Unknown player", clock=time.monotonic):
+        self.bot = line_bot_api
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.default_display_name = default_display_name
+        self.clock = clock
+        self.entries = OrderedDict()       # user_id -> (display_name, expiry). Least recently used first.
+        self.hits = 0
+        self.misses = 0
+        self.metrics = None                # Metrics registry, if profile fetches are to be timed
+    
+    def get_display_name(self, user_id):
+        """
+        Return display_name of user_id, from cache if still fresh.
+        """
+        display_name = self.lookup(user_id)
+        if display_name is None:
+            display_name = self.fetch(user_id)
+        return display_name
+    
+    def lookup(self, user_id):
+        """
+        Return the cached display_name of user_id, or None if
+        it is not cached or has expired.
+        """
+        entry = self.entries.get(user_id)
+        if entry is not None and entry[1] > self.clock():
+            self.entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        return None
+    
+    def fetch(self, user_id):
+        """
+        Fetch display_name of user_id with get_profile and cache it.
+        """
+        if self.bot is None:
+            # Profiles are stored from outside, e.g. by AsyncDispatcher.
+            return self.default_display_name
+        if self.metrics is not None:
+            start = time.perf_counter()
+        try:
+            display_name = self.bot.get_profile(user_id).display_name
+        except Exception:
+            # LineBotApiError and the like. Don't ask again for a while.
+            return self.store_failure(user_id)
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe("hangman_stage_seconds", time.perf_counter() - start, (("stage", "profile"),))
+        return self.store(user_id, display_name)
+    
+    def store(self, user_id, display_name, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        self.entries[user_id] = (display_name, self.clock() + ttl)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return display_name
+    
+    def store_failure(self, user_id):
+        return self.store(user_id, self.default_display_name, self.negative_ttl)
+    
+    def invalidate(self, user_id):
+        self.entries.pop(user_id, None)
+
+class MembershipIndex:
+    """
+    Which group each user plays in, and which users play in each group.
+    
+    Reads like the former user_id -> group_id dictionary. The reverse side,
+    group_id -> set of user_id, lets a whole group be dropped at the cost
+    of that group's size instead of a scan over every user.
+    """
+    def __init__(self):
+        self.group_of = {}                 # user_id -> group_id
+        self.members_of = {}               # group_id -> set of user_id
+    
+    def __contains__(self, user_id):
+        return user_id in self.group_of
+    
+    def __getitem__(self, user_id):
+        return self.group_of[user_id]
+    
+    def __len__(self):
+        return len(self.group_of)
+    
+    def get(self, user_id, default=None):
+        return self.group_of.get(user_id, default)
+    
+    def members(self, group_id):
+        return self.members_of.get(group_id, set())
+    
+    def add(self, user_id, group_id):
+        """
+        Record user_id as playing in group_id. A user plays in
+        one group at a time, so this does nothing if user_id
+        already plays somewhere.
+        """
+        if user_id not in self.group_of:
+            self.group_of[user_id] = group_id
+            self.members_of.setdefault(group_id, set()).add(user_id)
+    
+    def remove(self, user_id, group_id=None):
+        """
+        Remove user_id. If group_id is given, only if user_id
+        plays in group_id.
+        """
+        if group_id is not None and self.group_of.get(user_id) != group_id:
+            return
+        group_id = self.group_of.pop(user_id, None)
+        if group_id is not None:
+            members = self.members_of[group_id]
+            members.discard(user_id)
+            if not members:
+                del self.members_of[group_id]
+    
+    def remove_group(self, group_id):
+        """
+        Remove every member of group_id. Return the removed user_ids.
+        """
+        members = self.members_of.pop(group_id, set())
+        for user_id in members:
+            del self.group_of[user_id]
+        return members
+    
+    def verify(self):
+        """
+        Check both sides of the index agree. Return a list of
+        inconsistencies found, empty if none.
+        """
+        problems = []
+        for user_id, group_id in self.group_of.items():
+            if user_id not in self.members_of.get(group_id, ()):
+                problems.append("%r -> %r missing from group side" % (user_id, group_id))
+        for group_id, members in self.members_of.items():
+            if not members:
+                problems.append("%r has an empty member set" % (group_id,))
+            for user_id in members:
+                if self.group_of.get(user_id) != group_id:
+                    problems.append("%r in %r missing from user side" % (user_id, group_id))
+        return problems
+
+class GameCache:
+    """
+    Dictionary of group_id -> game that keeps at most max_resident games
+    in memory, spilling the rest to an on-disk shelf.
+    
+    Games are kept in least recently used order. Whenever more than
+    max_resident games are in memory, the least recently used ones are
+    pickled whole (scoreboard, waiting list, letter bitmasks, paused,
+    history and all) to the shelf at path and dropped from memory.
+    Looking a spilled game up loads it back, so callers see a plain
+    dictionary.
+    
+    last_activity holds the clock time each resident game was last looked
+    up. evict_idle spills every game idle for longer than some seconds.
+    
+    The shelf is only spill space for this process: it is emptied on
+    open, as Master's memberships don't outlive the process either.
+    
+    attach, if given, is called with (group_id, game) on every game loaded
+    back, to give it again what is not pickled with it.
+    """
+    def __init__(self, path, max_resident=1000, clock=time.monotonic, attach=None):
+        self.store = shelve.open(path, flag="n")   # str(group_id) -> game, for spilled games
+        self.max_resident = max_resident
+        self.clock = clock
+        self.attach = attach
+        self.resident = OrderedDict()      # group_id -> game. Least recently used first.
+        self.last_activity = {}            # group_id -> clock time of last lookup
+        self.evictions = 0
+        self.rehydrations = 0
+    
+    def __contains__(self, group_id):
+        return group_id in self.resident or str(group_id) in self.store
+    
+    def __getitem__(self, group_id):
+        game = self.resident.get(group_id)
+        if game is None:
+            # KeyError here if the group has no game at all.
+            game = self.store[str(group_id)]
+            del self.store[str(group_id)]
+            if self.attach is not None:
+                self.attach(group_id, game)
+            self.resident[group_id] = game
+            self.rehydrations += 1
+            self.evict_over_budget(keep=group_id)
+        else:
+            self.resident.move_to_end(group_id)
+        self.last_activity[group_id] = self.clock()
+        return game
+    
+    def __setitem__(self, group_id, game):
+        if str(group_id) in self.store:
+            del self.store[str(group_id)]
+        self.resident[group_id] = game
+        self.resident.move_to_end(group_id)
+        self.last_activity[group_id] = self.clock()
+        self.evict_over_budget(keep=group_id)
+    
+    def __delitem__(self, group_id):
+        if group_id in self.resident:
+            del self.resident[group_id]
+        else:
+            del self.store[str(group_id)]
+        self.last_activity.pop(group_id, None)
+    
+    def __len__(self):
+        return len(self.resident) + len(self.store)
+    
+    def get(self, group_id, default=None):
+        if group_id in self:
+            return self[group_id]
+        return default
+    
+    def evict(self, group_id):
+        """
+        Spill the resident game of group_id to the shelf.
+        """
+        self.store[str(group_id)] = self.resident.pop(group_id)
+        self.last_activity.pop(group_id, None)
+        self.evictions += 1
+    
+    def evict_over_budget(self, keep=None):
+        while len(self.resident) > self.max_resident:
+            group_id = next(iter(self.resident))
+            if group_id == keep:
+                break
+            self.evict(group_id)
+    
+    def evict_idle(self, idle_seconds):
+        """
+        Spill every resident game not looked up for idle_seconds.
+        """
+        deadline = self.clock() - idle_seconds
+        for group_id in list(self.resident):
+            if self.last_activity.get(group_id, deadline) > deadline:
+                # Resident games are in order of last lookup, the rest are newer.
+                break
+            self.evict(group_id)
+    
+    def close(self):
+        """
+        Spill every resident game and close the shelf.
+        """
+        for group_id in list(self.resident):
+            self.evict(group_id)
+        self.store.close()
+
 class Master:
     """
     Mastermind-type class to handle intermediary between LINE Messaging API
@@ -523,91 +1543,374 @@ class Master:
     respective game instances and resolved there, except add_game and 
     remove_game. Both require Mastermind intervention to interact with games.
     """
-    def __init__(self, line_bot_api):
+    game_class = Hangman                   # Game given to a group on /gameon
+    max_messages_per_reply = 5             # LINE takes at most five messages per reply or push call,
+    max_message_length = 5000              # of at most 5000 characters each
+    
+    def __init__(self, line_bot_api, profile_cache_size=1024, profile_ttl=3600,
+                 game_store_path=None, max_resident_games=1000, metrics=None, batch_window=0,
+                 lexicon=None, solver=None, leaderboard=None, rate_limiter=None):
         self.bot = line_bot_api
-        self.games = {}
-        self.memberships = {}
+        self.profiles = ProfileCache(line_bot_api, max_size=profile_cache_size, ttl=profile_ttl)
+        self.profiles.metrics = metrics
+        self.metrics = metrics             # hangman_metrics.Metrics, or None for no instrumentation
+        if game_store_path is None:
+            self.games = {}
+        else:
+            # Idle games are spilled to disk, see GameCache.
+            self.games = GameCache(game_store_path, max_resident=max_resident_games, attach=self.attach)
+        self.memberships = MembershipIndex()
+        self.batch_window = batch_window   # Seconds to gather letter guesses of a group into one reply. 0 is off.
+        self.batches = {}                  # group_id -> [opened at, latest token, [(user_id, letter), ...]]
+        self.push_queue = deque()          # (to, text) that didn't fit in their reply, see flush_pushes
+        self.messages_merged = 0           # Messages saved by merging neighbours, see pack_messages
+        self.push_calls_saved = 0          # Push calls saved by packing per destination, against one per message
+        self.messages_pushed = 0
+        self.lexicon = lexicon             # hangman_lexicon.Lexicon given to every new game, or None
+        self.solver = solver               # hangman_solver.Solver given to every new game, or None
+        self.leaderboard = leaderboard     # Leaderboard fed by every game, or None
+        self.rate_limiter = rate_limiter   # hangman_ratelimit.RateLimiter events must pass, or None
         self.keyword_add_game = "/gameon"        # "Give this group a (Hangman) game."
         self.keyword_remove_game = "/gameoff"    # "Remove game from this group."
         self.keyword_leave = "/goaway"           # "Leave from this group."
+        self.known_keywords = {self.keyword_add_game, self.keyword_remove_game, self.keyword_leave}
+        self.known_keywords.update(getattr(self.game_class, name) for name in dir(self.game_class)
+                                   if name.startswith("keyword_"))
+        
+        # Tables for classify. Games that don't say what they ignore are passed everything.
+        self.public_commands = {self.keyword_leave: "leave",
+                                self.keyword_add_game: "add_game",
+                                self.keyword_remove_game: "remove_game"}
+        self.drop_chatter = not getattr(self.game_class, "listens_to_chatter", True)
+        private_keywords = getattr(self.game_class, "private_keywords", None)
+        self.private_keywords = None if private_keywords is None else frozenset(private_keywords)
     
-    def send_reply(self, token, messenger):
+    def send_reply(self, token, channel, messenger, group_id=None, to=None):
+        """
+        Apply the membership changes of messenger and send its reply
+        array, packed by pack_messages. Messages past what one reply
+        takes are queued to be pushed to to, the group or user the
+        event came from, or dropped if to is None.
+        """
+        if messenger is None:
+            # Common chat, the game has nothing to say.
+            return
+        
         reply_array = messenger.reply_array
         join_user = messenger.join_user
         unjoin_user = messenger.unjoin_user
         
         if join_user is not None:
-            self.add_player_to_game(join_user)
+            self.add_player_to_game(join_user, group_id)
         
         if unjoin_user is not None:
-            pass
+            self.remove_player_from_game(unjoin_user, group_id)
         
-        chat_array = [TextSendMessage(text=u) for u in reply_array]
+        if reply_array:
+            metrics = self.metrics
+            if metrics is not None:
+                start = time.perf_counter()
+            texts = self.pack_messages(reply_array)
+            if to is not None:
+                for text in texts[self.max_messages_per_reply:]:
+                    self.push_queue.append((to, text))
+            chat_array = [TextSendMessage(text=u) for u in texts[:self.max_messages_per_reply]]
+            if metrics is not None:
+                rendered = time.perf_counter()
+                metrics.observe("hangman_stage_seconds", rendered - start, (("stage", "render"),))
+                metrics.observe("hangman_reply_messages", len(chat_array), buckets=COUNT_BUCKETS)
+                for message in chat_array:
+                    metrics.observe("hangman_message_chars", len(message.text), buckets=SIZE_BUCKETS)
+            if not chat_array:
+                return
+            self.post_reply(token, chat_array)
+            if metrics is not None:
+                metrics.observe("hangman_stage_seconds", time.perf_counter() - rendered, (("stage", "send"),))
+    
+    def post_reply(self, token, chat_array):
         self.bot.reply_message(
             token,
             chat_array
         )
     
+    def post_push(self, to, chat_array):
+        self.bot.push_message(to, chat_array)
+    
+    def pack_messages(self, reply_array):
+        """
+        Fit reply_array into as few messages as it can go in. Replies
+        over max_message_length are split at line boundaries, then
+        neighbouring small ones are merged, smallest pair first, for as
+        long as there are more than one reply call takes. Empty replies
+        are dropped. Return the texts of the messages.
+        """
+        limit = self.max_message_length
+        messages = []
+        for text in reply_array:
+            if len(text) > limit:
+                messages.extend(split_message(text, limit))
+            elif text:
+                messages.append(text)
+        
+        while len(messages) > self.max_messages_per_reply:
+            smallest = None
+            for i in range(len(messages) - 1):
+                size = len(messages[i]) + 2 + len(messages[i + 1])
+                if size <= limit and (smallest is None or size < smallest[0]):
+                    smallest = (size, i)
+            if smallest is None:
+                # Nothing fits together. The rest goes in push calls.
+                break
+            i = smallest[1]
+            messages[i:i + 2] = [messages[i] + "\n\n" + messages[i + 1]]
+            self.messages_merged += 1
+        return messages
+    
+    def flush_pushes(self):
+        """
+        Push every queued message, packed per destination into as few
+        push calls as they go in. With long replies about, call this
+        every second or so, like flush_batches.
+        """
+        pending = OrderedDict()            # to -> texts, in the order first queued
+        while self.push_queue:
+            to, text = self.push_queue.popleft()
+            pending.setdefault(to, []).append(text)
+        
+        limit = self.max_messages_per_reply
+        for to, texts in pending.items():
+            queued = len(texts)
+            texts = self.pack_messages(texts)
+            self.push_calls_saved += queued - (len(texts) + limit - 1) // limit
+            for start in range(0, len(texts), limit):
+                chat_array = [TextSendMessage(text=u) for u in texts[start:start + limit]]
+                self.messages_pushed += len(chat_array)
+                self.post_push(to, chat_array)
+    
     def add_player_to_game(self, user_id, group_id):
-        if user_id not in self.memberships:
-            self.memberships[user_id] = group_id
-        pass
+        self.memberships.add(user_id, group_id)
     
-    def remove_player_from_game(self, user_id):
-        if user_id in self.memberships:
-            del self.memberships[user_id]
-        pass
+    def remove_player_from_game(self, user_id, group_id=None):
+        self.memberships.remove(user_id, group_id)
+    
+    def attach(self, group_id, game):
+        """
+        Give game what every game of the Master shares. Called on
+        add_game, and again whenever the game is unpickled.
+        """
+        if self.lexicon is not None:
+            # One mapping shared by every game, see Lexicon.
+            game.lexicon = self.lexicon
+        if self.solver is not None:
+            game.solver = self.solver
+        if self.leaderboard is not None:
+            game.leaderboard = self.leaderboard
     
     def add_game(self, group_id, game):
         if group_id not in self.games:
+            self.attach(group_id, game)
             self.games[group_id] = game
         pass
     
     def remove_game(self, group_id):
         if group_id in self.games:
-            self.memberships = {k: v for k, v in self.memberships.items() if v != group_id}
+            self.memberships.remove_group(group_id)
             del self.games[group_id]
         pass
     
+    def add_to_batch(self, token, user_id, letter, group_id):
+        now = time.monotonic()
+        batch = self.batches.get(group_id)
+        if batch is None:
+            batch = self.batches[group_id] = [now, token, []]
+        batch[1] = token
+        batch[2].append((user_id, letter))
+        if now - batch[0] >= self.batch_window:
+            self.flush_batch(group_id)
+    
+    def flush_batch(self, group_id):
+        """
+        Apply the gathered letter guesses of group_id in one go,
+        replying once with the latest reply token.
+        """
+        batch = self.batches.pop(group_id, None)
+        if batch is not None and group_id in self.games:
+            self.send_reply(
+                batch[1], "public",
+                self.games[group_id].guess_batch(batch[2]),
+                group_id, to=group_id
+            )
+    
+    def flush_batches(self, force=False):
+        """
+        Flush every batch open for batch_window seconds, or every batch
+        if force. With batching on, call this every batch_window or so
+        from the thread calling query_reply, so a lone guess is not held.
+        """
+        now = time.monotonic()
+        due = [group_id for group_id, batch in self.batches.items()
+               if force or now - batch[0] >= self.batch_window]
+        for group_id in due:
+            self.flush_batch(group_id)
+    
+    def import_words(self, group_id, path, user_id):
+        """
+        Admin entry to seed the game of group_id from a word-pack file
+        at path, one word or phrase per line. Words are credited to
+        user_id as giver. Return the game's summary Messenger, or None
+        if group_id has no game.
+        """
+        if group_id not in self.games:
+            return None
+        with open(path, encoding="utf-8") as word_pack:
+            return self.games[group_id].import_words(word_pack, user_id)
+    
     def leave_group(self, group_id):
         self.remove_game(group_id)
         self.bot.leave_group(group_id)
     
+    def command_of(self, channel, received_text):
+        """
+        Name the kind of command received_text is, for metrics.
+        """
+        keyword = received_text.split(" ", 1)[0]
+        if keyword in self.known_keywords:
+            return keyword
+        if channel == "private":
+            return "private"
+        if keyword.startswith("/"):
+            return "word"
+        if len(received_text) == 1:
+            return "letter"
+        return "chatter"
+    
+    def dump_metrics(self, path, format="prometheus"):
+        self.metrics.set_gauge("hangman_games", len(self.games))
+        self.metrics.set_gauge("hangman_members", len(self.memberships))
+        self.metrics.set_gauge("hangman_profile_cache_hits", self.profiles.hits)
+        self.metrics.set_gauge("hangman_profile_cache_misses", self.profiles.misses)
+        self.metrics.set_gauge("hangman_messages_merged", self.messages_merged)
+        self.metrics.set_gauge("hangman_push_calls_saved", self.push_calls_saved)
+        self.metrics.set_gauge("hangman_messages_pushed", self.messages_pushed)
+        self.metrics.set_gauge("hangman_push_queue", len(self.push_queue))
+        if self.rate_limiter is not None:
+            self.metrics.set_gauge("hangman_rate_limit_buckets", len(self.rate_limiter))
+            for command, dropped in self.rate_limiter.limited.items():
+                self.metrics.set_gauge("hangman_rate_limited", dropped, (("command", command),))
+        self.metrics.dump(path, format)
+    
+    def pass_to_game(self, game, channel, received_text, user_id, display_name, group_id):
+        if self.metrics is None:
+            return game.parse_and_reply(channel, received_text, user_id, display_name, group_id)
+        start = time.perf_counter()
+        messenger = game.parse_and_reply(channel, received_text, user_id, display_name, group_id)
+        self.metrics.observe("hangman_stage_seconds", time.perf_counter() - start, (("stage", "dispatch"),))
+        return messenger
+    
     def query_reply(self, token, channel, received_text, user_id, **kwargs):
-        display_name = self.bot.get_profile(user_id).display_name
+        if self.metrics is None:
+            return self.dispatch(token, channel, received_text, user_id, **kwargs)
+        start = time.perf_counter()
+        try:
+            return self.dispatch(token, channel, received_text, user_id, **kwargs)
+        finally:
+            labels = (("command", self.command_of(channel, received_text)),)
+            self.metrics.increment("hangman_events_total", labels)
+            self.metrics.observe("hangman_event_seconds", time.perf_counter() - start, labels)
+    
+    def classify(self, channel, received_text):
+        """
+        Tokenize received_text once into the kind of command it is:
+        "leave", "add_game" or "remove_game" for Master keywords, "letter"
+        or "word" for guesses, "game" for anything else for the game and
+        "ignore" for what no one would answer.
+        """
+        if channel == "public":
+            if len(received_text) == 1:
+                return "letter" if received_text != "/" else "word"
+            if not received_text:
+                return "ignore"
+            if received_text[0] == "/":
+                command = self.public_commands.get(received_text)
+                if command is not None:
+                    return command
+                if received_text.split(None, 1)[0] == self.keyword_add_game:
+                    # /gameon with scoring.
+                    return "add_game"
+                if received_text in self.known_keywords:
+                    return "game"
+                return "word"
+            if received_text[0].isspace() and received_text.split(None, 1)[:1] == [self.keyword_add_game]:
+                return "add_game"
+            return "ignore" if self.drop_chatter else "game"
+        
+        if self.private_keywords is None:
+            return "game"
+        words = received_text.split(None, 1)
+        if words and words[0] in self.private_keywords:
+            return "game"
+        return "ignore"
+    
+    def dispatch(self, token, channel, received_text, user_id, **kwargs):
+        command = self.classify(channel, received_text)
+        if command == "ignore":
+            # Plain chat. Dropped before any profile lookup or game access,
+            # but still closing letter guesses gathered before it.
+            if self.batches and kwargs.get("group_id") in self.batches:
+                self.flush_batch(kwargs.get("group_id"))
+            return
+        if self.rate_limiter is not None and not self.rate_limiter.allow(
+                command if channel == "public" else "private", user_id, kwargs.get("group_id")):
+            # Over the limit, e.g. a pasted alphabet or a scripted /add
+            # flood. Dropped as plain chat is, without a reply.
+            return
+        
+        # Profile is looked up only if the game asks for it, by calling display_name.
+        display_name = partial(self.profiles.get_display_name, user_id)
         if channel == "public":
             group_id = kwargs.get("group_id")
             # This is group chat, proceeds to listen to keywords:
             
-            if received_text == self.keyword_leave:
+            if self.batch_window and group_id in self.games:
+                if command == "letter" and hasattr(self.games[group_id], "guess_batch"):
+                    # A letter guess. Gather it, reply later with the batch.
+                    self.add_to_batch(token, user_id, received_text, group_id)
+                    return
+                # Anything else goes after the guesses gathered before it.
+                self.flush_batch(group_id)
+            
+            if command == "leave":
                 # A /goaway is received.
                 if group_id in self.games:
                     self.send_reply(
                         token, channel,
-                        self.games[group_id].show_goodbye()
+                        self.games[group_id].show_goodbye(),
+                        to=group_id
                     )
                 self.leave_group(group_id)
             
             elif group_id not in self.games:
                 # No group in this game. Listen only to /gameon.
-                if received_text.split()[0] == self.keyword_add_game:
+                if command == "add_game":
                     try:
-                        self.add_game(group_id, Hangman(int(received_text.split()[1]), int(received_text.split()[2])))
+                        self.add_game(group_id, self.game_class(int(received_text.split()[1]), int(received_text.split()[2])))
                     except (IndexError, ValueError) as error:
-                        self.add_game(group_id, Hangman())
+                        self.add_game(group_id, self.game_class())
                     
                     self.send_reply(
                         token, channel,
-                        self.games[group_id].show_hello()
+                        self.games[group_id].show_hello(),
+                        to=group_id
                     )
                     
             else:
                 # Group has active game, listen for /gameoff and keywords.
-                if received_text == self.keyword_remove_game:
+                if command == "remove_game":
                     # A /gameoff is received.
                     self.send_reply(
                         token, channel,
-                        self.games[group_id].show_goodbye()
+                        self.games[group_id].show_goodbye(),
+                        to=group_id
                     )
                     self.remove_game(group_id)
                 
@@ -615,21 +1918,28 @@ class Master:
                     # Master does not recognize, passes to Hangman.
                     self.send_reply(
                         token, channel,
-                        self.games[group_id].parse_and_reply(
+                        self.pass_to_game(
+                            self.games[group_id],
                             channel, received_text, user_id, display_name, group_id
-                        )
+                        ),
+                        group_id, to=group_id
                     )
         elif channel == "private":
             # Pass to Hangman, let it decide what to reply.
-            if user_id in memberships:
+            if user_id in self.memberships:
+                group_id = self.memberships[user_id]
                 self.send_reply(
                     token, channel,
-                    self.games[self.memberships[user_id]].parse_and_reply(
+                    self.pass_to_game(
+                        self.games[group_id],
                         channel, received_text, user_id, display_name, group_id = None
-                    )
+                    ),
+                    group_id, to=user_id
                 )
 
 class TemplateGameClass:
+    __slots__ = ()
+    
     def __init__(self):
         pass
     
@@ -0,0 +1,92 @@
+import asyncio
+import unittest
+
+from fake_line_bot import FakeAsyncLineBotApi
+from hangman_async import AsyncDispatcher, AsyncMaster
+
+class InFlightLineBotApi(FakeAsyncLineBotApi):
+    """
+    Fake client noting how many replies are in flight at once, overall
+    and per group. Reply tokens are the group_id, then a sequence number.
+    """
+    def __init__(self, latency):
+        FakeAsyncLineBotApi.__init__(self, latency=latency)
+        self.in_flight = {}
+        self.most_in_flight = {}
+
+    async def reply_message(self, reply_token, messages):
+        group_id = reply_token.split("-")[0]
+        for key in (group_id, None):
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+            self.most_in_flight[key] = max(self.most_in_flight.get(key, 0), self.in_flight[key])
+        try:
+            await FakeAsyncLineBotApi.reply_message(self, reply_token, messages)
+        finally:
+            for key in (group_id, None):
+                self.in_flight[key] -= 1
+
+class AsyncDispatcherTest(unittest.TestCase):
+    def run_async(self, coroutine):
+        return asyncio.run(coroutine)
+
+    def test_flush_sends_pushes(self):
+        async def run():
+            bot = FakeAsyncLineBotApi(latency=0.001)
+            dispatcher = AsyncDispatcher(bot)
+            for i in range(12):
+                dispatcher.master.push_queue.append(("G", "x" * 3000))
+            await dispatcher.flush()
+            return bot, dispatcher
+
+        bot, dispatcher = self.run_async(run())
+        self.assertEqual(dispatcher.master.outbox, [])
+        self.assertEqual(sum(len(messages) for to, messages in bot.pushes), 12)
+        self.assertTrue(all(to == "G" for to, messages in bot.pushes))
+
+    def test_flush_answers_lone_batched_guess(self):
+        async def run():
+            bot = FakeAsyncLineBotApi()
+            dispatcher = AsyncDispatcher(bot, master=AsyncMaster(bot, batch_window=0.01))
+            flusher = asyncio.create_task(dispatcher.flush_periodically())
+            await dispatcher.submit("t1", "public", "/gameon", "host", group_id="G")
+            await dispatcher.submit("t2", "public", "/join", "giver", group_id="G")
+            await dispatcher.submit("t3", "public", "/join", "guesser", group_id="G")
+            await dispatcher.join()
+            dispatcher.master.games["G"].add_word("HANGMAN", "giver")
+            await dispatcher.submit("t4", "public", "/continue", "host", group_id="G")
+            await dispatcher.submit("t5", "public", "A", "guesser", group_id="G")
+            await dispatcher.join()
+            replied = len(bot.replies)
+            await asyncio.sleep(0.05)
+            flusher.cancel()
+            return bot, replied
+
+        bot, replied = self.run_async(run())
+        self.assertEqual(replied, 4)
+        self.assertEqual(len(bot.replies), 5)
+        self.assertEqual(bot.replies[-1][0], "t5")
+
+    def test_groups_ordered_and_overlapping(self):
+        groups = ["A", "B", "C", "D"]
+
+        async def run():
+            bot = InFlightLineBotApi(latency=0.005)
+            dispatcher = AsyncDispatcher(bot)
+            for group_id in groups:
+                await dispatcher.submit(group_id + "-0", "public", "/gameon", "host", group_id=group_id)
+            for i in range(1, 11):
+                for group_id in groups:
+                    await dispatcher.submit(group_id + "-" + str(i), "public", "/scoreboard", "host",
+                                            group_id=group_id)
+            await dispatcher.join()
+            return bot
+
+        bot = self.run_async(run())
+        for group_id in groups:
+            tokens = [token for token, messages in bot.replies if token.startswith(group_id + "-")]
+            self.assertEqual(tokens, [group_id + "-" + str(i) for i in range(11)])
+            self.assertEqual(bot.most_in_flight[group_id], 1)
+        self.assertGreater(bot.most_in_flight[None], 1)
+
+if __name__ == "__main__":
+    unittest.main()
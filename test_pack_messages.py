@@ -0,0 +1,33 @@
+import random
+import unittest
+
+from modular_hangman import Master, split_message
+
+class SplitMessageTest(unittest.TestCase):
+    """
+    Every piece split_message makes is a message LINE takes: not
+    empty, not only newlines, and at most limit characters.
+    """
+    def assertPieces(self, pieces, limit):
+        for piece in pieces:
+            self.assertTrue(piece.strip("\n"), pieces)
+            self.assertLessEqual(len(piece), limit)
+
+    def test_blank_line_next_to_full_line(self):
+        master = Master(None)
+        limit = master.max_message_length
+        messages = master.pack_messages(["a" * limit + "\n\n" + "b" * limit])
+        self.assertEqual(messages, ["a" * limit, "b" * limit])
+
+    def test_random_texts(self):
+        r = random.Random(0)
+        for trial in range(5000):
+            text = "".join(r.choice("ab \n") for i in range(r.randint(0, 30)))
+            limit = r.randint(1, 6)
+            pieces = split_message(text, limit)
+            self.assertPieces(pieces, limit)
+            # Only line breaks may go, nothing else.
+            self.assertEqual("".join(pieces).replace("\n", ""), text.replace("\n", ""))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from modular_hangman import Hangman
+
+class RenderCacheTest(unittest.TestCase):
+    """
+    get_scoreboard and show_history hand back the same text until a
+    score, the history or the participants change.
+    """
+    def setUp(self):
+        self.game = Hangman()
+        self.game.include_participant("alice", "Alice")
+        self.game.include_participant("bob", "Bob")
+        self.game.add_word("HANGMAN", "bob")
+        self.game.continue_game()
+        self.game.guess("alice", "H")
+
+    def history(self):
+        return self.game.show_history().reply_array[0]
+
+    def test_repeat_is_cached(self):
+        self.assertIs(self.game.get_scoreboard(), self.game.get_scoreboard())
+        self.assertIs(self.history(), self.history())
+
+    def test_guess_renders_again(self):
+        scoreboard, history = self.game.get_scoreboard(), self.history()
+        self.game.guess("alice", "A")
+        self.assertNotEqual(self.game.get_scoreboard(), scoreboard)
+        self.assertIn("Alice: 2", self.game.get_scoreboard())
+        self.assertNotEqual(self.history(), history)
+        self.assertIn("Alice | A | 1", self.history())
+
+    def test_guess_word_renders_again(self):
+        scoreboard, history = self.game.get_scoreboard(), self.history()
+        self.game.guess_word("alice", "HANGMAN")
+        self.assertNotEqual(self.game.get_scoreboard(), scoreboard)
+        self.assertNotEqual(self.history(), history)
+        self.assertIn("Alice | HANGMAN", self.history())
+
+    def test_include_participant_renders_again(self):
+        scoreboard, history = self.game.get_scoreboard(), self.history()
+        self.game.include_participant("carol", "Carol")
+        self.assertNotEqual(self.game.get_scoreboard(), scoreboard)
+        self.assertIn("Carol: 0", self.game.get_scoreboard())
+        # Same text, rendered again.
+        self.assertEqual(self.history(), history)
+        self.assertIsNot(self.history(), history)
+
+    def test_join_again_is_cached(self):
+        scoreboard, history = self.game.get_scoreboard(), self.history()
+        self.game.include_participant("alice", "Alice")
+        self.assertIs(self.game.get_scoreboard(), scoreboard)
+        self.assertIs(self.history(), history)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+from fake_line_bot import FakeLineBotApi
+from hangman_shard import ShardedMaster, shard_of
+
+class ShardedMasterTest(unittest.TestCase):
+    """
+    Private chat reaches the game of the user's group, on the shard
+    owning that group, through the shared routing table.
+    """
+    shards = 2
+    groups = ["G%d" % group for group in range(6)]
+
+    def setUp(self):
+        self.master = ShardedMaster(FakeLineBotApi, shards=self.shards)
+        self.addCleanup(self.master.close)
+        for group_id in self.groups:
+            self.master.query_reply("token", "public", "/gameon", "host", group_id=group_id)
+            for player in range(2):
+                self.master.query_reply("token", "public", "/join", group_id + "-" + str(player), group_id=group_id)
+        self.master.report()
+
+    def add_words(self, text):
+        for group_id in self.groups:
+            for player in range(2):
+                self.master.query_reply("token", "private", "/add " + text + " " + group_id + "-" + str(player),
+                                        group_id + "-" + str(player))
+        return {group_id: (row["shard"], words)
+                for row in self.master.report() for group_id, words in row["waiting"].items()}
+
+    def test_add_lands_in_group_of_user(self):
+        waiting = self.add_words("WORD OF")
+        self.assertEqual(sorted(waiting), self.groups)
+        for group_id, (shard, words) in waiting.items():
+            self.assertEqual(shard, shard_of(group_id, self.shards))
+            self.assertEqual(words, ["WORD OF " + group_id + "-0", "WORD OF " + group_id + "-1"])
+
+    def test_quit_and_gameoff_release_routing(self):
+        self.master.query_reply("token", "public", "/quit", "G0-1", group_id="G0")
+        self.master.query_reply("token", "public", "/gameoff", "host", group_id="G1")
+        self.master.report()
+        routing = dict(self.master.routing)
+        self.assertNotIn("G0-1", routing)
+        self.assertNotIn("G1-0", routing)
+        self.assertNotIn("G1-1", routing)
+        self.assertEqual(routing["G0-0"], shard_of("G0", self.shards))
+
+        waiting = self.add_words("LATER WORD")
+        self.assertNotIn("G1", waiting)
+        self.assertEqual(waiting["G0"][1], ["LATER WORD G0-0"])
+
+if __name__ == "__main__":
+    unittest.main()
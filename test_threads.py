@@ -0,0 +1,86 @@
+import random
+import string
+import threading
+import unittest
+
+from fake_line_bot import FakeBlockingLineBotApi
+from hangman_threads import ThreadedMaster
+from modular_hangman import Master
+
+class SignallingLock:
+    """
+    Group lock that tells when someone starts waiting on it.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiting = threading.Event()
+
+    def __enter__(self):
+        self.waiting.set()
+        self.lock.acquire()
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+
+class ThreadedMasterTest(unittest.TestCase):
+    def run_steps(self, master, steps):
+        for step in steps:
+            for future in [master.submit("token", channel, text, user_id, group_id=group_id)
+                           for channel, text, user_id, group_id in step]:
+                future.result()
+
+    def test_no_lost_updates(self):
+        # Every player but the giver guesses every letter, all groups at once.
+        groups, players = 8, 3
+        generator = random.Random(0)
+        words = ["".join(generator.choice(string.ascii_uppercase) for i in range(generator.randint(8, 20)))
+                 for group in range(groups)]
+        master = ThreadedMaster(FakeBlockingLineBotApi(latency=0.001), max_workers=8)
+        self.addCleanup(master.shutdown)
+        self.run_steps(master, [
+            [("public", "/gameon", "host", "G%d" % group) for group in range(groups)],
+            [("public", "/join", "U%d-%d" % (group, player), "G%d" % group)
+             for group in range(groups) for player in range(players)],
+            [("private", "/add " + words[group], "U%d-0" % group, None) for group in range(groups)],
+            [("public", "/continue", "U%d-0" % group, "G%d" % group) for group in range(groups)],
+        ])
+        events = [("public", letter, "U%d-%d" % (group, player), "G%d" % group)
+                  for group in range(groups) for player in range(1, players)
+                  for letter in string.ascii_uppercase]
+        generator.shuffle(events)
+        self.run_steps(master, [events])
+
+        lost = 0
+        for group in range(groups):
+            game = master.games["G%d" % group]
+            scored = sum(score for user_id, score in game.scoreboard.ranking())
+            lost += abs(len(set(words[group])) * game.score_per_letter - scored)
+        self.assertEqual(lost, 0)
+        self.assertEqual(master.memberships.verify(), [])
+        self.assertEqual(len(master.memberships), groups * players)
+
+    def test_private_chat_follows_moved_user(self):
+        master = ThreadedMaster(FakeBlockingLineBotApi(), max_workers=2)
+        self.addCleanup(master.shutdown)
+        self.run_steps(master, [
+            [("public", "/gameon", "host", "A"), ("public", "/gameon", "host", "B")],
+            [("public", "/join", "mover", "A")],
+        ])
+        lock = master.group_locks["A"] = SignallingLock()
+
+        with lock.lock:
+            # /add looks up A, then waits on its lock...
+            future = master.submit("token", "private", "/add BANANA SPLIT", "mover")
+            self.assertTrue(lock.waiting.wait(5))
+            # ...while, under that lock, the user quits A and joins B.
+            Master.query_reply(master, "token", "public", "/quit", "mover", group_id="A")
+            self.run_steps(master, [[("public", "/join", "mover", "B")]])
+        future.result()
+
+        self.assertEqual(master.group_of("mover"), "B")
+        self.assertEqual(list(master.games["A"].waiting_list), [])
+        self.assertEqual(list(master.games["B"].waiting_list), ["BANANA SPLIT"])
+        self.assertEqual(master.memberships.verify(), [])
+
+if __name__ == "__main__":
+    unittest.main()